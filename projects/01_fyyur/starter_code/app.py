@@ -2,20 +2,41 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import base64
+import click
 import json
-import sys
+import os
+import threading
+import time
 import dateutil.parser
-import babel
+import gzip
 from datetime import datetime, timedelta
+from functools import wraps
+from hashlib import sha1
+from itertools import groupby
 from flask_migrate import Migrate
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, make_response, stream_with_context, g, has_request_context, session
+from flask.cli import AppGroup
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import Formatter, FileHandler
+from jinja2 import FileSystemBytecodeCache
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
 from flask_wtf import Form
 from forms import *
+from search import ranked_search
+from importer import BATCH_SIZE, BookingCheck, import_rows, read_rows
+from cache import LRUCache, RedisCache, ResponseCache
+from logs import setup_logging
+from assets import Assets, build_assets
+from autocomplete import PrefixIndex
+from profiling import QueryProfiler
+from scheduling import MAX_AVAILABILITY_WINDOW, SHOW_DURATION, find_conflicts, free_intervals, overlaps
+import formatting
+from formatting import DEFAULT_LOCALE
+from sqlalchemy import case, event, or_, text, tuple_
+from werkzeug.http import is_resource_modified
 from sqlalchemy.sql import func
+from sqlalchemy.exc import IntegrityError
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -24,16 +45,116 @@ from sqlalchemy.sql import func
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+class RoutingSession(SignallingSession):
+  '''
+  Sends reads to the 'replica' bind while a view decorated with
+  replica_reads runs; flushes, and everything outside those views, go to
+  the primary.
+  '''
+
+  def __init__(self, db, **options):
+    self.db = db
+    super(RoutingSession, self).__init__(db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    if not self._flushing and has_request_context() and g.get('use_replica'):
+      return self.db.get_engine(self.app, bind='replica')
+    return super(RoutingSession, self).get_bind(mapper, clause)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def stick_to_primary(session):
+  if has_request_context():
+    g.wrote_primary = True
+
+class FyyurSQLAlchemy(SQLAlchemy):
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def create_engine(self, sa_url, engine_opts):
+    # SQLALCHEMY_ENGINE_OPTIONS apply to every bind; drop what doesn't fit
+    # the driver and add the Postgres statement timeout.
+    if sa_url.drivername.startswith('postgres'):
+      timeout = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+      if timeout:
+        connect_args = dict(engine_opts.get('connect_args', {}))
+        connect_args.setdefault('options', '-c statement_timeout=%d' % timeout)
+        engine_opts['connect_args'] = connect_args
+    elif sa_url.drivername == 'sqlite':
+      # SQLite gets a static or null pool, which take no sizing options.
+      for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+        engine_opts.pop(option, None)
+    return super(FyyurSQLAlchemy, self).create_engine(sa_url, engine_opts)
+
+db = FyyurSQLAlchemy(app)
 migrate = Migrate(app,db)
+query_profiler = QueryProfiler(app)
+assets = Assets(app)
+
+def create_page_cache_backend():
+  redis_url = app.config.get('PAGE_CACHE_REDIS_URL')
+  if redis_url:
+    import redis
+    return RedisCache(redis.Redis.from_url(redis_url))
+  return LRUCache(app.config.get('PAGE_CACHE_SIZE', 1024))
+
+page_cache = ResponseCache(create_page_cache_backend(),
+                           ttl=app.config.get('PAGE_CACHE_TTL', 300),
+                           enabled=app.config.get('PAGE_CACHE_ENABLED', True),
+                           vary=lambda: request_locale())
+
+def replica_reads(view):
+  '''
+  Run the view's queries on the replica bind, when one is configured and
+  the user has not written anything in the last REPLICA_STICKY_SECONDS,
+  so they always read their own writes.
+
+  A page rendered from the replica may miss writes it has not caught up
+  with yet, so it is only cached for REPLICA_STICKY_SECONDS; a user inside
+  the window skips the page cache and refreshes it from the primary.
+  '''
+  @wraps(view)
+  def wrapper(**kwargs):
+    g.use_replica = False
+    if 'replica' in (app.config.get('SQLALCHEMY_BINDS') or {}):
+      sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+      g.use_replica = session.get('primary_until', 0) <= time.time()
+      if g.use_replica:
+        g.page_cache_ttl = min(page_cache.ttl, sticky_seconds)
+      else:
+        g.page_cache_refresh = True
+    return view(**kwargs)
+  return wrapper
+
+@app.after_request
+def remember_write(response):
+  if g.get('wrote_primary'):
+    session['primary_until'] = time.time() + app.config.get('REPLICA_STICKY_SECONDS', 5)
+  return response
+
+def template_bytecode_cache(cache_dir):
+  os.makedirs(cache_dir, exist_ok=True)
+  return FileSystemBytecodeCache(cache_dir)
+
+# Compiled templates are read from here instead of being recompiled by
+# every new worker; fill it with 'flask fyyur compile-templates'.
+if app.config.get('TEMPLATE_CACHE_DIR'):
+  app.jinja_env.bytecode_cache = template_bytecode_cache(app.config['TEMPLATE_CACHE_DIR'])
 
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+def trigram_index(table, column):
+    return db.Index('ix_%s_%s_trgm' % (table, column), column,
+                    postgresql_using='gin',
+                    postgresql_ops={column: 'gin_trgm_ops'})
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = tuple(trigram_index('Venue', column) for column in ('name', 'city', 'state')) + (
+      db.Index('ix_Venue_state_city_id', 'state', 'city', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String,nullable = False)
@@ -46,6 +167,9 @@ class Venue(db.Model):
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean,nullable = False)
     seeking_description = db.Column(db.String(120))
+    upcoming_shows_count = db.Column(db.Integer,nullable = False,default = 0)
+    past_shows_count = db.Column(db.Integer,nullable = False,default = 0)
+    updated_at = db.Column(db.DateTime,nullable = False,default = datetime.utcnow,onupdate = datetime.utcnow)
    
 
 
@@ -53,27 +177,52 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = tuple(trigram_index('Artist', column) for column in ('name', 'city', 'state')) + (
+      db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String,nullable = False)
     city = db.Column(db.String(120),nullable = False)
     state = db.Column(db.String(120),nullable = False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String),nullable = False)
+    genres = db.Column(db.ARRAY(db.String).with_variant(db.JSON, 'sqlite'),nullable = False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean,nullable = False)
     seeking_description = db.Column(db.String(120))
+    upcoming_shows_count = db.Column(db.Integer,nullable = False,default = 0)
+    past_shows_count = db.Column(db.Integer,nullable = False,default = 0)
+    updated_at = db.Column(db.DateTime,nullable = False,default = datetime.utcnow,onupdate = datetime.utcnow)
 
   
 
+class GenreCount(db.Model):
+  __tablename__ = 'GenreCount'
+  genre = db.Column(db.String(120), primary_key=True)
+  artist_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+
+def default_end_time(context):
+  return context.get_current_parameters()['start_time'] + SHOW_DURATION
+
 class Show(db.Model):
   __tablename__ = 'Show'
+  __table_args__ = (
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+  )
   id=db.Column(db.Integer, primary_key=True)
   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
   start_time = db.Column(db.DateTime,nullable = False)
+  # Double bookings are excluded on Postgres by the ex_Show_venue_booking
+  # and ex_Show_artist_booking constraints (migration a1c5e9d3f7b2).
+  end_time = db.Column(db.DateTime,nullable = False,default = default_end_time)
+  updated_at = db.Column(db.DateTime,nullable = False,default = datetime.utcnow,onupdate = datetime.utcnow)
   venue = db.relationship('Venue',backref = 'shows',)
   artist = db.relationship('Artist',backref = 'shows')
 
@@ -84,21 +233,439 @@ class Show(db.Model):
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(value, format,locale='en_US')
+def request_locale():
+  '''The best supported locale for the current request's Accept-Language.'''
+  supported = app.config.get('SUPPORTED_LOCALES', [DEFAULT_LOCALE])
+  if not has_request_context():
+    return supported[0]
+  locale = request.environ.get('fyyur.locale')
+  if locale is None:
+    locale = request.accept_languages.best_match(supported, default=supported[0])
+    request.environ['fyyur.locale'] = locale
+  return locale
+
+def format_datetime(value, format='medium', locale=None):
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  return formatting.format_datetime(value, format, locale or request_locale())
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+@app.after_request
+def vary_on_locale(response):
+  # Anything that looked up the locale (rendering dates, the page cache
+  # key, the ETag) differs by Accept-Language, and shared caches must know.
+  if 'fyyur.locale' in request.environ:
+    response.vary.add('Accept-Language')
+  return response
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# Past shows beyond this many (most recent first) are counted but not listed.
+PAST_SHOWS_LIMIT = 50
+
+def load_show_detail(model, entity_id, show_key, other, other_key, prefix, past_limit=PAST_SHOWS_LIMIT):
+  '''
+  Load a venue or artist together with its shows in one query.
+
+  `show_key` is the Show column pointing at `model` and `other_key` the one
+  pointing at `other`, whose id, name and image_link are returned under
+  `prefix`. Shows are split around the current time: every upcoming show
+  is returned, past ones are capped at `past_limit` while their counts
+  stay exact. Aborts with 404 if the entity doesn't exist.
+  '''
+  now = datetime.now()
+  is_past = Show.start_time < now
+
+  shows = db.session.query(
+                show_key.label('entity_id'),
+                other_key.label(prefix + '_id'),
+                other.name.label(prefix + '_name'),
+                other.image_link.label(prefix + '_image_link'),
+                Show.start_time,
+                func.row_number().over(partition_by=is_past, order_by=Show.start_time.desc()).label('recent_rank'),
+                func.count().over(partition_by=is_past).label('bucket_total'))\
+              .join(other, other.id == other_key)\
+              .filter(show_key == entity_id)\
+              .subquery()
+
+  rows = db.session.query(model, shows)\
+              .outerjoin(shows, shows.c.entity_id == model.id)\
+              .filter(model.id == entity_id)\
+              .filter(or_(shows.c.start_time == None,
+                          shows.c.start_time >= now,
+                          shows.c.recent_rank <= past_limit))\
+              .order_by(shows.c.start_time)\
+              .all()
+  if not rows:
+    abort(404)
+
+  detail = {
+    'upcoming_shows': [],
+    'past_shows': [],
+    'upcoming_shows_count': 0,
+    'past_shows_count': 0
+  }
+  for row in rows:
+    if row.start_time is None:
+      continue
+    bucket = 'past' if row.start_time < now else 'upcoming'
+    detail[bucket + '_shows'].append(row)
+    detail[bucket + '_shows_count'] = row.bucket_total
+  detail['past_shows'].reverse()
+
+  return rows[0][0], detail
+
+def load_page_version(model, entity_id, show_key, other, other_key):
+  '''
+  Compute the (etag, last_modified) of a venue or artist page from one
+  aggregate over its shows, without loading them. Returns (None, None)
+  if the entity doesn't exist.
+
+  Besides the updated_at of everything the page displays, the version
+  covers the number of shows and how many are past, so deleted shows and
+  shows moving from upcoming to past change it too.
+  '''
+  now = datetime.now()
+  row = db.session.query(
+                model.updated_at,
+                func.max(Show.updated_at).label('shows_updated_at'),
+                func.max(other.updated_at).label('others_updated_at'),
+                func.max(case([(Show.start_time < now, Show.start_time)])).label('last_past_start'),
+                func.count(Show.id).label('shows'),
+                func.sum(case([(Show.start_time < now, 1)], else_=0)).label('past_shows'))\
+              .select_from(model)\
+              .outerjoin(Show, show_key == model.id)\
+              .outerjoin(other, other.id == other_key)\
+              .filter(model.id == entity_id)\
+              .group_by(model.id)\
+              .first()
+  if row is None:
+    return None, None
+
+  # updated_at is UTC while start_time is naive local time.
+  utc_offset = datetime.utcnow() - now
+  timestamps = [row.updated_at, row.shows_updated_at, row.others_updated_at,
+                row.last_past_start + utc_offset if row.last_past_start else None]
+  last_modified = max(timestamp for timestamp in timestamps if timestamp).replace(microsecond=0)
+
+  etag = sha1(repr((model.__tablename__, entity_id) + tuple(row)).encode('utf-8')).hexdigest()
+  return etag, last_modified
+
+# upcoming_shows_count / past_shows_count on Venue and Artist, keyed by the
+# Show column pointing at each. Show writes adjust them in their own
+# transaction; 'flask fyyur rollover' moves shows that have since started
+# from upcoming to past.
+SHOW_COUNTERS = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+def adjust_show_counts(show, delta):
+  '''Add delta to the counters of show's venue and artist.'''
+  column = 'past_shows_count' if show.start_time < datetime.now() else 'upcoming_shows_count'
+  for model, show_key in SHOW_COUNTERS:
+    counter = getattr(model, column)
+    model.query\
+      .filter(model.id == getattr(show, show_key))\
+      .update({counter: counter + delta}, synchronize_session=False)
+
+def recount_shows(model, show_key, ids=None):
+  '''Recompute model's show counters from Show, for ids or every row.'''
+  now = datetime.now()
+  def count(condition):
+    return db.session.query(func.count(Show.id))\
+              .filter(getattr(Show, show_key) == model.id)\
+              .filter(condition)\
+              .as_scalar()
+
+  query = model.query
+  if ids is not None:
+    query = query.filter(model.id.in_(ids))
+  return query.update({
+    model.upcoming_shows_count: count(Show.start_time >= now),
+    model.past_shows_count: count(Show.start_time < now),
+  }, synchronize_session=False)
+
+def is_sqlite():
+  return db.session.get_bind().dialect.name == 'sqlite'
+
+def genre_filter(genres, match='all'):
+  '''
+  Filter artists having all of genres, or any of them with match='any'.
+  On Postgres this is @> / && against the GIN index on Artist.genres.
+  '''
+  if not is_sqlite():
+    genres = db.cast(genres, db.ARRAY(db.String))
+    return Artist.genres.op('&&' if match == 'any' else '@>')(genres)
+
+  params = dict(('genre_%d' % i, genre) for i, genre in enumerate(genres))
+  if match == 'any':
+    clause = 'EXISTS (SELECT 1 FROM json_each("Artist".genres) WHERE value IN (%s))' % \
+      ', '.join(':' + name for name in params)
+  else:
+    clause = ' AND '.join('EXISTS (SELECT 1 FROM json_each("Artist".genres) WHERE value = :%s)' % name
+                          for name in params)
+  return text('(' + clause + ')').bindparams(**params)
+
+# An upsert, so two writers adding a genre's first artist both count it
+# instead of one failing on the primary key (Postgres, and SQLite >= 3.24).
+ADD_GENRE_ARTIST = text(
+  'INSERT INTO "GenreCount" (genre, artist_count) VALUES (:genre, 1) '
+  'ON CONFLICT (genre) DO UPDATE SET artist_count = "GenreCount".artist_count + 1')
+
+def adjust_genre_counts(added=(), removed=()):
+  '''
+  Keep GenreCount in step with an artist write, in the same transaction:
+  the row-level writes serialize concurrent writers on the same genre.
+  '''
+  for genre in added:
+    db.session.execute(ADD_GENRE_ARTIST, {'genre': genre})
+  if removed:
+    GenreCount.query\
+      .filter(GenreCount.genre.in_(list(removed)))\
+      .update({GenreCount.artist_count: GenreCount.artist_count - 1},
+              synchronize_session=False)
+
+def recount_genres():
+  '''Rebuild GenreCount from scratch, e.g. after a bulk import.'''
+  if is_sqlite():
+    counts = 'SELECT value, count(*) FROM "Artist", json_each("Artist".genres) GROUP BY value'
+  else:
+    counts = 'SELECT genre, count(*) FROM "Artist", unnest(genres) AS genre GROUP BY genre'
+  GenreCount.query.delete(synchronize_session=False)
+  db.session.execute('INSERT INTO "GenreCount" (genre, artist_count) ' + counts)
+
+SHOW_COUNT_SORTS = {'upcoming': 'num_upcoming_shows', 'past': 'num_past_shows'}
+
+SHOWS_PER_PAGE = 30
+MAX_PER_PAGE = 100
+
+# Columns the show listings can select, by field name.
+SHOW_COLUMNS = {
+  'id': Show.id,
+  'venue_id': Show.venue_id,
+  'venue_name': Venue.name,
+  'artist_id': Show.artist_id,
+  'artist_name': Artist.name,
+  'artist_image_link': Artist.image_link,
+  'start_time': Show.start_time,
+  'end_time': Show.end_time,
+}
+
+def show_listing(fields):
+  '''
+  Show query selecting `fields` of SHOW_COLUMNS, joining the venue and
+  the artist only when one of their columns is selected.
+  '''
+  columns = [SHOW_COLUMNS[name] for name in fields]
+  query = Show.query
+  if any(column.table is Venue.__table__ for column in columns):
+    query = query.join(Show.venue)
+  if any(column.table is Artist.__table__ for column in columns):
+    query = query.join(Show.artist)
+  return query.with_entities(*[column.label(name) for name, column in zip(fields, columns)])
+
+def encode_cursor(values):
+  payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+  return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, keys):
+  '''
+  Decode an opaque cursor back into one value per key column, aborting with
+  400 if it was tampered with or built for a different ordering.
+  '''
+  try:
+    payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    if not isinstance(payload, list) or len(payload) != len(keys):
+      raise ValueError(cursor)
+    return [decode_cursor_value(key, value) for key, value in zip(keys, payload)]
+  except (ValueError, TypeError, OverflowError):
+    abort(400)
+
+def decode_cursor_value(key, value):
+  if isinstance(key.type, db.DateTime):
+    if not isinstance(value, str):
+      raise TypeError(value)
+    return dateutil.parser.isoparse(value)
+  if isinstance(key.type, db.Integer):
+    if not isinstance(value, int) or isinstance(value, bool):
+      raise TypeError(value)
+    return value
+  if not isinstance(value, str):
+    raise TypeError(value)
+  return value
+
+class KeysetPage(object):
+  '''
+  One page of `query`, ordered by `keys` descending and seeking past
+  `cursor` instead of using OFFSET, so every page costs the same index
+  range scan however deep it is.
+
+  The rows are fetched on first access, which lets a streamed template
+  flush the page header before the query runs.
+  '''
+
+  def __init__(self, query, keys, cursor=None, per_page=SHOWS_PER_PAGE):
+    if cursor:
+      query = query.filter(tuple_(*keys) < tuple_(*decode_cursor(cursor, keys)))
+    self.keys = keys
+    self.per_page = per_page
+    self._query = query.order_by(*[key.desc() for key in keys]).limit(per_page + 1)
+    self._items = None
+    self.has_next = False
+
+  @property
+  def items(self):
+    if self._items is None:
+      rows = self._query.all()
+      self.has_next = len(rows) > self.per_page
+      self._items = rows[:self.per_page]
+    return self._items
+
+  def __iter__(self):
+    return iter(self.items)
+
+  @property
+  def next_cursor(self):
+    items = self.items
+    if not self.has_next:
+      return None
+    return encode_cursor([getattr(items[-1], key.key) for key in self.keys])
+
+def parse_window_arg(name, default):
+  '''Naive local datetime from an ISO 8601 query argument.'''
+  value = request.args.get(name)
+  if not value:
+    return default
+  parsed = dateutil.parser.isoparse(value)
+  if parsed.tzinfo is not None:
+    parsed = parsed.astimezone().replace(tzinfo=None)
+  return parsed
+
+def per_page_arg(default):
+  return max(1, min(request.args.get('per_page', default, type=int), MAX_PER_PAGE))
+
+def render_page(template_name, **context):
+  '''
+  render_template, or a streamed response when STREAM_TEMPLATES is set so
+  the first bytes go out before the whole page has been rendered.
+  '''
+  if not app.config.get('STREAM_TEMPLATES'):
+    return render_template(template_name, **context)
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return Response(stream_with_context(template.stream(context)))
+
+#----------------------------------------------------------------------------#
+# Caches.
+#----------------------------------------------------------------------------#
+
+# The /venues page lists every venue grouped by (city, state). The grouping only
+# changes when a venue is created, edited or deleted, so it is built with a single
+# ordered query and kept in process until one of those handlers invalidates it,
+# or for at most VENUE_AREAS_MAX_AGE seconds, which picks up show counts moved by
+# 'flask fyyur rollover', imports and writes made by other processes.
+_venue_areas = None
+_venue_areas_loaded = None
+_venue_areas_generation = 0
+_venue_areas_lock = threading.Lock()
+
+def load_venue_areas():
+  global _venue_areas, _venue_areas_loaded
+
+  areas = _venue_areas
+  max_age = app.config.get('VENUE_AREAS_MAX_AGE', 300)
+  if areas is not None and time.monotonic() - _venue_areas_loaded <= max_age:
+    return areas
+
+  generation = _venue_areas_generation
+  rows = Venue.query\
+              .with_entities(Venue.id, Venue.name, Venue.city, Venue.state,
+                             Venue.upcoming_shows_count, Venue.past_shows_count)\
+              .order_by(Venue.state, Venue.city, Venue.id)\
+              .all()
+
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.upcoming_shows_count,
+        "num_past_shows": venue.past_shows_count,
+      } for venue in venues]
+    })
+
+  with _venue_areas_lock:
+    # Don't publish a listing that was read before a concurrent invalidation.
+    if generation == _venue_areas_generation:
+      _venue_areas = areas
+      _venue_areas_loaded = time.monotonic()
+  return areas
+
+def invalidate_venue_areas():
+  global _venue_areas, _venue_areas_generation
+
+  with _venue_areas_lock:
+    _venue_areas_generation += 1
+    _venue_areas = None
+
+# Venue and artist names for /autocomplete. Loaded on first use, updated by
+# this process's create/edit/delete handlers, and reloaded every
+# AUTOCOMPLETE_MAX_AGE seconds to pick up writes from other workers and
+# imports.
+name_index = PrefixIndex(max_age=app.config.get('AUTOCOMPLETE_MAX_AGE', 300))
+_name_index_lock = threading.Lock()
+
+def load_name_index():
+  if not name_index.is_stale():
+    return name_index
+  with _name_index_lock:
+    if name_index.is_stale():
+      entries = [('venue', row.id, row.name) for row in Venue.query.with_entities(Venue.id, Venue.name)]
+      entries += [('artist', row.id, row.name) for row in Artist.query.with_entities(Artist.id, Artist.name)]
+      name_index.build(entries)
+  return name_index
+
+def conditional_page(load_version):
+  '''
+  Answer conditional GETs for the decorated view with 304 before it runs.
+  load_version(**view_args) returns (etag, last_modified), or (None, None)
+  for a missing record.
+  '''
+  def decorator(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+      etag, last_modified = load_version(**kwargs)
+      if etag is None:
+        abort(404)
+      # Dates on the page are formatted for the request's locale.
+      etag += '-' + request_locale()
+
+      if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        # Key the page cache on the version too, so a body cached before
+        # the record changed is never sent under the new ETag.
+        g.page_cache_version = etag
+        response = make_response(view(**kwargs))
+      else:
+        response = Response(status=304)
+      response.set_etag(etag)
+      response.last_modified = last_modified
+      # Let browsers and the CDN keep the page but revalidate every time.
+      response.cache_control.public = True
+      response.cache_control.no_cache = True
+      return response
+    return wrapper
+  return decorator
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
+@page_cache.cached()
 def index():
   return render_template('pages/home.html')
 
@@ -106,69 +673,76 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
+# Not routed to the replica: the area listing stays cached in process until
+# the next venue write, so filling it from a lagging replica could pin
+# stale data.
 @app.route('/venues')
+@page_cache.cached('venues')
 def venues():
-  
-  data = []
-  areas = Venue.query\
-              .with_entities(Venue.city,Venue.state)\
-              .group_by(Venue.city,Venue.state)\
-              .all()
-  venues = []
-  for area in areas:
-    venue = Venue.query\
-              .with_entities(Venue.id,Venue.name)\
-              .filter(Venue.city == area.city)\
-              .filter(Venue.state == area.state)\
-              .all()
-    
-    data.append({
-      "city" : area.city,
-      "state": area.state,
-      "venues" : venue
-    })
-
-  return render_template('pages/venues.html', areas=data);
+  areas = load_venue_areas()
+  sort = request.args.get('sort')
+  if sort in SHOW_COUNT_SORTS:
+    # The cached listing is shared, so sort copies of the area lists.
+    key = SHOW_COUNT_SORTS[sort]
+    areas = [dict(area, venues=sorted(area['venues'], key=lambda venue: -venue[key]))
+             for area in areas]
+  return render_template('pages/venues.html', areas=areas, sort=sort)
 
 @app.route('/venues/search', methods=['POST'])
+@replica_reads
 def search_venues():
   
-  query = '%' + request.form.get('search_term','') + '%'
-
-  search_query = Venue.query.filter(Venue.name.ilike(query))
+  search_term = request.form.get('search_term', '')
+  total, matches = ranked_search(db.session, Venue, search_term)
 
   search_results  = {
-    "count": search_query.count(),
-    "data": search_query.with_entities(Venue.id,Venue.name).all()
+    "count": total,
+    "data": matches
   }
- 
-  return render_template('pages/search_venues.html', results=search_results, search_term=request.form.get('search_term', ''))
+
+  return render_template('pages/search_venues.html', results=search_results, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@replica_reads
+@conditional_page(lambda venue_id: load_page_version(Venue, venue_id, Show.venue_id, Artist, Show.artist_id))
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   
-  current_time = datetime.now()
-  
-  venue = Venue.query\
-              .filter(Venue.id == venue_id)\
-              .one()
-              
+  venue, shows = load_show_detail(Venue, venue_id, Show.venue_id, Artist, Show.artist_id, 'artist')
+  page_cache.tag(*['artist:%d' % show.artist_id for show in shows['upcoming_shows'] + shows['past_shows']])
 
-  show_query = Show.query\
-              .filter(Show.venue_id == venue_id)\
-              .join(Artist)\
-              .with_entities(Show.artist_id,Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'),Show.start_time)
+  return render_template('pages/show_venue.html', venue=venue, shows=shows)
 
-  past_query = show_query.filter(Show.start_time < current_time)
-
-  upcoming_query = show_query.filter(Show.start_time > current_time)
-
-  venue.upcoming_shows = upcoming_query.all()
-  venue.past_shows  = past_query.all()
-  venue.upcoming_shows_count = len(venue.upcoming_shows)
-  venue.past_shows_count = len(venue.past_shows)
-
-  return render_template('pages/show_venue.html', venue=venue)
+@app.route('/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+  try:
+    start = parse_window_arg('from', datetime.now())
+    end = parse_window_arg('to', start + timedelta(days=7))
+  except (ValueError, OverflowError):
+    abort(400)
+  if end <= start or end - start > MAX_AVAILABILITY_WINDOW:
+    abort(400)
+
+  # One query: the venue outer-joined to the shows overlapping the window,
+  # so a missing venue and a free week are told apart.
+  rows = db.session.query(Venue.id, Show.id, Show.start_time, Show.end_time)\
+            .outerjoin(Show, db.and_(Show.venue_id == Venue.id, overlaps(db.session, Show, start, end)))\
+            .filter(Venue.id == venue_id)\
+            .order_by(Show.start_time, Show.id)\
+            .all()
+  if not rows:
+    abort(404)
+
+  busy = [(row[2], row[3]) for row in rows if row[1] is not None]
+  return jsonify({
+    'venue_id': venue_id,
+    'from': start.isoformat(),
+    'to': end.isoformat(),
+    'busy': [{'show_id': row[1], 'start_time': row[2].isoformat(), 'end_time': row[3].isoformat()}
+             for row in rows if row[1] is not None],
+    'free': [{'start_time': free_start.isoformat(), 'end_time': free_end.isoformat()}
+             for free_start, free_end in free_intervals(busy, start, end)],
+  })
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -211,83 +785,94 @@ def create_venue_submission():
   try:
     db.session.add(venue)
     db.session.commit()
+    invalidate_venue_areas()
+    name_index.put('venue', venue.id, venue.name)
+    page_cache.invalidate('venues')
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   except:
     db.session.rollback()
-    print(sys.exc_info())
+    app.logger.exception('could not create venue')
     flash('An error occurred. Venue ' +  request.form['name']+ ' could not be listed.')
-  finally:
-    db.session.close()
   
   return render_template('pages/home.html')
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   venue = Venue.query.get(venue_id)
+  success = False
   
   try:
-    db.seesion.delete(venue)
+    db.session.delete(venue)
     db.session.commit()
+    invalidate_venue_areas()
+    name_index.remove('venue', int(venue_id))
+    page_cache.invalidate('venues', 'venue:%s' % venue_id, 'shows')
+    success = True
   except:
     db.session.rollback()
-    print(sys.exc_info())
-  finally:
-    db.session.close()
+    app.logger.exception('could not delete venue %s', venue_id)
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  return jsonify({'success': success})
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@replica_reads
+@page_cache.cached('artists')
 def artists():
-
-  artists = Artist.query\
-            .with_entities(Artist.id,Artist.name)\
+  genres = request.args.getlist('genre')
+  state = request.args.get('state')
+  match = 'any' if request.args.get('match') == 'any' else 'all'
+
+  sort = request.args.get('sort')
+
+  artist_query = Artist.query.with_entities(Artist.id,Artist.name,
+                                            Artist.upcoming_shows_count.label('num_upcoming_shows'),
+                                            Artist.past_shows_count.label('num_past_shows'))
+  if genres:
+    artist_query = artist_query.filter(genre_filter(genres, match))
+  if state:
+    artist_query = artist_query.filter(Artist.state == state)
+  if sort == 'upcoming':
+    artist_query = artist_query.order_by(Artist.upcoming_shows_count.desc(), Artist.id)
+  elif sort == 'past':
+    artist_query = artist_query.order_by(Artist.past_shows_count.desc(), Artist.id)
+
+  genre_counts = GenreCount.query\
+            .filter(GenreCount.artist_count > 0)\
+            .order_by(GenreCount.artist_count.desc(), GenreCount.genre)\
             .all()
 
-  return render_template('pages/artists.html', artists=artists)
+  return render_template('pages/artists.html', artists=artist_query.all(),
+                         genre_counts=genre_counts, selected_genres=genres,
+                         state=state, match=match, sort=sort)
 
 @app.route('/artists/search', methods=['POST'])
+@replica_reads
 def search_artists():
   
-  query = '%' + request.form.get('search_term','') + '%'
-
-  search_query = Artist.query.filter(Artist.name.ilike(query))
+  search_term = request.form.get('search_term', '')
+  total, matches = ranked_search(db.session, Artist, search_term)
 
   search_results  = {
-    "count": search_query.count(),
-    "data": search_query.with_entities(Artist.id,Artist.name).all()
+    "count": total,
+    "data": matches
   }
 
-  return render_template('pages/search_artists.html', results=search_results, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=search_results, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@replica_reads
+@conditional_page(lambda artist_id: load_page_version(Artist, artist_id, Show.artist_id, Venue, Show.venue_id))
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
-  current_time = datetime.now()
-  artist = Artist.query\
-              .filter(Artist.id == artist_id)\
-              .one()
-              
-
-  show_query = Show.query\
-              .filter(Show.artist_id == artist_id)\
-              .join(Venue)\
-              .with_entities(Show.venue_id,Venue.name.label('venue_name'),Venue.image_link.label('venue_image_link'),Show.start_time)
 
-  past_query = show_query.filter(Show.start_time < current_time)
+  artist, shows = load_show_detail(Artist, artist_id, Show.artist_id, Venue, Show.venue_id, 'venue')
+  page_cache.tag(*['venue:%d' % show.venue_id for show in shows['upcoming_shows'] + shows['past_shows']])
 
-  upcoming_query = show_query.filter(Show.start_time > current_time)
-
-  artist.upcoming_shows = upcoming_query.all()
-  artist.past_shows  = past_query.all()
-  artist.upcoming_shows_count = len(artist.upcoming_shows)
-  artist.past_shows_count = len(artist.past_shows)
-
-  print(artist.past_shows)
-
-  return render_template('pages/show_artist.html', artist=artist)
+  return render_template('pages/show_artist.html', artist=artist, shows=shows)
 
 #  Update
 #  ----------------------------------------------------------------
@@ -307,18 +892,21 @@ def edit_artist_submission(artist_id):
     flash('An error occurred in your form. Please fill it out again')
     return render_template('forms/edit_artist.html', form=form, artist=artist)
   try:
+    old_genres = set(artist.genres or [])
+    new_genres = set(request.form.getlist('genres'))
     artist.name = request.form['name']
     artist.city = request.form['city']
     artist.state = request.form['state']
     artist.phone = request.form['phone']
-    artist.genres = request.form['genres']
+    artist.genres = sorted(new_genres)
     artist.facebook_link = request.form['facebook_link']
+    adjust_genre_counts(added=new_genres - old_genres, removed=old_genres - new_genres)
     db.session.commit()
+    name_index.put('artist', artist_id, artist.name)
+    page_cache.invalidate('artists', 'artist:%d' % artist_id, 'shows')
   except:
     db.session.rollback()
 
-  finally:
-    db.session.close()
   
   return redirect(url_for('show_artist', artist_id=artist_id))
 
@@ -348,11 +936,12 @@ def edit_venue_submission(venue_id):
     venue.phone = request.form['phone']
     venue.facebook_link = request.form['facebook_link']
     db.session.commit()
+    invalidate_venue_areas()
+    name_index.put('venue', venue_id, venue.name)
+    page_cache.invalidate('venues', 'venue:%d' % venue_id, 'shows')
   except:
     db.session.rollback()
 
-  finally:
-    db.session.close()
 
   return redirect(url_for('show_venue', venue_id=venue_id))
 
@@ -396,15 +985,16 @@ def create_artist_submission():
       seeking_description=seeking_description
     )
     db.session.add(artist)
+    adjust_genre_counts(added=set(genres))
     db.session.commit()
+    name_index.put('artist', artist.id, artist.name)
+    page_cache.invalidate('artists')
 
     flash('Artist ' + name + ' was successfully listed!')
   except:
     db.session.rollback()
 
     flash('An error occurred. Artist ' + name + ' could not be listed.')
-  finally:
-    db.session.close()
   return render_template('pages/home.html')
 
 
@@ -412,15 +1002,17 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@replica_reads
+@page_cache.cached('shows')
 def shows():
-  shows = Show.query \
-              .join(Show.artist) \
-              .join(Show.venue) \
-              .order_by(Show.start_time.desc()) \
-              .with_entities(Show.venue_id, Venue.name.label('venue_name'), Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'), Show.start_time) \
-              .all()
-  
-  return render_template('pages/shows.html', shows=shows)
+  show_query = show_listing(['id', 'venue_id', 'venue_name', 'artist_id', 'artist_name',
+                             'artist_image_link', 'start_time'])
+
+  shows = KeysetPage(show_query, [Show.start_time, Show.id],
+                     cursor=request.args.get('cursor'),
+                     per_page=per_page_arg(SHOWS_PER_PAGE))
+
+  return render_page('pages/shows.html', shows=shows)
 
 @app.route('/shows/create')
 def create_shows():
@@ -435,42 +1027,366 @@ def create_show_submission():
     flash('An error occurred in your form. Please fill it out again')
     return render_template('forms/new_show.html', form=form)
 
-  artist_id = request.form['artist_id']
-  venue_id = request.form['venue_id']
-  start_time = request.form['start_time']
+  artist_id = form.artist_id.data
+  venue_id = form.venue_id.data
+  start_time = form.start_time.data
+  end_time = form.end_time.data
+
+  conflicts = find_conflicts(db.session, Show, start_time, end_time,
+                             venue_id=venue_id, artist_id=artist_id)
+  if conflicts:
+    for conflict in conflicts:
+      flash('Conflicts with show %d (%s to %s) %s.' % (
+        conflict.id, format_datetime(conflict.start_time), format_datetime(conflict.end_time),
+        'at this venue' if conflict.venue_id == venue_id else 'by this artist'))
+    return render_template('forms/new_show.html', form=form)
 
   try:
-    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
+    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=end_time)
     db.session.add(show)
+    db.session.flush()
+    adjust_show_counts(show, 1)
     db.session.commit()
+    invalidate_venue_areas()
+    page_cache.invalidate('shows', 'venues', 'artists',
+                          'venue:%d' % show.venue_id, 'artist:%d' % show.artist_id)
 
     flash('Show was successfully listed!')
+  except IntegrityError:
+    # A concurrent booking got in between the check and the insert.
+    db.session.rollback()
+    flash('An error occurred. The venue or artist is already booked at that time.')
   except:
     db.session.rollback()
     flash('An error occurred. Show could not be listed.')
-  finally:
-    db.session.close()
   
   return render_template('pages/home.html')
 
+@app.route('/shows/<int:show_id>', methods=['DELETE'])
+def delete_show(show_id):
+  show = Show.query.get_or_404(show_id)
+  venue_id, artist_id = show.venue_id, show.artist_id
+  success = False
+
+  try:
+    db.session.delete(show)
+    db.session.flush()
+    # Recounted rather than decremented: the show may have started since
+    # it was counted as upcoming, before a rollover ran.
+    recount_shows(Venue, 'venue_id', [venue_id])
+    recount_shows(Artist, 'artist_id', [artist_id])
+    db.session.commit()
+    invalidate_venue_areas()
+    page_cache.invalidate('shows', 'venues', 'artists',
+                          'venue:%d' % venue_id, 'artist:%d' % artist_id)
+    success = True
+  except:
+    db.session.rollback()
+    app.logger.exception('could not delete show %d', show_id)
+
+  return jsonify({'success': success})
+
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+@app.route('/autocomplete')
+def autocomplete():
+  '''Venues and artists with a word in their name starting with ?q=, by name.'''
+  prefix = request.args.get('q', '')
+  limit = min(max(request.args.get('limit', 10, type=int), 1), AUTOCOMPLETE_MAX_LIMIT)
+  index = load_name_index()
+  return jsonify({
+    kind + 's': [{'id': entity_id, 'name': name} for entity_id, name in index.search(kind, prefix, limit)]
+    for kind in ('venue', 'artist')
+  })
+
+#  API
+#  ----------------------------------------------------------------
+
+API_PER_PAGE = 50
+API_DEFAULT_FIELDS = {
+  Venue: ('id', 'name', 'city', 'state'),
+  Artist: ('id', 'name', 'city', 'state', 'genres'),
+}
+API_DEFAULT_SHOW_FIELDS = ('id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'start_time')
+API_COMPRESS_MIN_SIZE = 500
+
+def api_error(status, message):
+  abort(make_response(jsonify({'error': message}), status))
+
+def api_fields(available, default):
+  '''Field names from ?fields=a,b,c, all of which must be in available.'''
+  requested = request.args.get('fields')
+  if not requested:
+    return list(default)
+  fields = [name.strip() for name in requested.split(',') if name.strip()]
+  unknown = [name for name in fields if name not in available]
+  if unknown or not fields:
+    api_error(400, 'unknown fields: %s' % ', '.join(unknown) if unknown else 'no fields requested')
+  return fields
+
+def api_value(value):
+  return value.isoformat() if isinstance(value, datetime) else value
+
+def api_record(row, fields):
+  return dict((name, api_value(getattr(row, name))) for name in fields)
+
+def api_page(query, keys, fields):
+  page = KeysetPage(query, keys, cursor=request.args.get('cursor'),
+                    per_page=per_page_arg(API_PER_PAGE))
+  return jsonify({'data': [api_record(row, fields) for row in page],
+                  'next_cursor': page.next_cursor})
+
+def api_entity_query(model, fields):
+  '''model query selecting only fields (plus id, the cursor key).'''
+  names = fields if 'id' in fields else ['id'] + fields
+  return model.query.with_entities(*[model.__table__.c[name] for name in names])
+
+@app.after_request
+def compress_api_response(response):
+  if not is_api_request() or response.direct_passthrough or \
+     'Content-Encoding' in response.headers or not request.accept_encodings['gzip']:
+    return response
+  response.vary.add('Accept-Encoding')
+  data = response.get_data()
+  if len(data) >= API_COMPRESS_MIN_SIZE:
+    response.set_data(gzip.compress(data, 6))
+    response.headers['Content-Encoding'] = 'gzip'
+  return response
+
+@app.route('/api/v1/venues')
+@replica_reads
+def api_venues():
+  fields = api_fields(Venue.__table__.c.keys(), API_DEFAULT_FIELDS[Venue])
+  query = api_entity_query(Venue, fields)
+  for name in ('city', 'state'):
+    if request.args.get(name):
+      query = query.filter(Venue.__table__.c[name] == request.args[name])
+  return api_page(query, [Venue.id], fields)
+
+@app.route('/api/v1/venues/<int:venue_id>')
+@replica_reads
+def api_venue(venue_id):
+  fields = api_fields(Venue.__table__.c.keys(), API_DEFAULT_FIELDS[Venue])
+  venue = api_entity_query(Venue, fields).filter(Venue.id == venue_id).first()
+  if venue is None:
+    api_error(404, 'venue %d not found' % venue_id)
+  return jsonify({'data': api_record(venue, fields)})
+
+@app.route('/api/v1/artists')
+@replica_reads
+def api_artists():
+  fields = api_fields(Artist.__table__.c.keys(), API_DEFAULT_FIELDS[Artist])
+  query = api_entity_query(Artist, fields)
+  if request.args.get('state'):
+    query = query.filter(Artist.state == request.args['state'])
+  genres = request.args.getlist('genre')
+  if genres:
+    query = query.filter(genre_filter(genres, 'any' if request.args.get('match') == 'any' else 'all'))
+  return api_page(query, [Artist.id], fields)
+
+@app.route('/api/v1/artists/<int:artist_id>')
+@replica_reads
+def api_artist(artist_id):
+  fields = api_fields(Artist.__table__.c.keys(), API_DEFAULT_FIELDS[Artist])
+  artist = api_entity_query(Artist, fields).filter(Artist.id == artist_id).first()
+  if artist is None:
+    api_error(404, 'artist %d not found' % artist_id)
+  return jsonify({'data': api_record(artist, fields)})
+
+@app.route('/api/v1/shows')
+@replica_reads
+def api_shows():
+  fields = api_fields(SHOW_COLUMNS, API_DEFAULT_SHOW_FIELDS)
+  # The cursor keys have to be selected even when not asked for.
+  selected = fields + [name for name in ('start_time', 'id') if name not in fields]
+  query = show_listing(selected)
+  for name in ('venue_id', 'artist_id'):
+    value = request.args.get(name, type=int)
+    if value is not None:
+      query = query.filter(SHOW_COLUMNS[name] == value)
+  return api_page(query, [Show.start_time, Show.id], fields)
+
+#  Monitoring
+#  ----------------------------------------------------------------
+
+@app.route('/_debug/cache')
+def page_cache_stats():
+  if not app.config.get('DEBUG_ENDPOINTS'):
+    abort(404)
+  return jsonify(page_cache.stats())
+
+@app.route('/_debug/queries', methods=['GET', 'DELETE'])
+def query_stats():
+  if not app.config.get('DEBUG_ENDPOINTS'):
+    abort(404)
+  if request.method == 'DELETE':
+    query_profiler.reset()
+  return jsonify(query_profiler.report())
+
+@app.route('/_debug/logging')
+def logging_stats():
+  if not app.config.get('DEBUG_ENDPOINTS'):
+    abort(404)
+  if log_handler is None:
+    return jsonify({'enabled': False})
+  return jsonify({'enabled': True, 'queued': log_handler.queue.qsize(), 'dropped': log_handler.dropped})
+
+def is_api_request():
+    return request.path.startswith('/api/')
+
+@app.errorhandler(400)
+def bad_request_error(error):
+    if is_api_request():
+        return jsonify({'error': error.description}), 400
+    return error
+
 @app.errorhandler(404)
 def not_found_error(error):
+    if is_api_request():
+        return jsonify({'error': 'not found'}), 404
     return render_template('errors/404.html'), 404
 
 @app.errorhandler(500)
 def server_error(error):
+    if is_api_request():
+        return jsonify({'error': 'internal server error'}), 500
     return render_template('errors/500.html'), 500
 
 
+log_handler = None
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+    log_handler = setup_logging(app)
+
+def page_templates():
+  return app.jinja_env.list_templates(extensions=['html'])
+
+def load_templates():
+  '''Load every template into the environment's cache; returns the count.'''
+  names = page_templates()
+  for name in names:
+    app.jinja_env.get_template(name)
+  return len(names)
+
+# Load templates at startup rather than on the first request to each page.
+# Runs after the filters are registered, which compiling needs.
+if app.config.get('PRELOAD_TEMPLATES'):
+  load_templates()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+app.cli.add_command(fyyur_cli)
+
+IMPORTS = {
+  'venues': (Venue, VenueForm),
+  'artists': (Artist, ArtistForm),
+  'shows': (Show, ShowForm),
+}
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True,
+              help='Rows inserted and committed per batch.')
+def import_command(kind, source, fmt, batch_size):
+  '''Bulk import venues, artists or shows from CSV or JSON Lines.
+
+  Rows are validated with the same rules as the HTML forms. CSV columns
+  are the form field names; list fields such as genres are separated
+  with ';'.
+  '''
+  model, form_class = IMPORTS[kind]
+  if fmt is None:
+    fmt = 'csv' if source.name.endswith('.csv') else 'jsonl'
+
+  def report_batch(imported, elapsed):
+    click.echo('%s: %d rows imported (%.0f rows/s)' % (kind, imported, imported / max(elapsed, 1e-6)))
+
+  def report_reject(line_num, errors):
+    click.echo('line %d rejected: %s' % (line_num, json.dumps(errors)), err=True)
+
+  try:
+    imported, rejected = import_rows(db.session, model.__table__, form_class,
+                                     read_rows(source, fmt), batch_size=batch_size,
+                                     on_batch=report_batch, on_reject=report_reject,
+                                     check=BookingCheck(db.session, Show) if kind == 'shows' else None)
+  except Exception as e:
+    db.session.rollback()
+    raise click.ClickException('import stopped, the current batch was rolled back: %s' % e)
+  finally:
+    if kind == 'venues':
+      invalidate_venue_areas()
+    if kind == 'artists':
+      recount_genres()
+      db.session.commit()
+    if kind == 'shows':
+      for counted, show_key in SHOW_COUNTERS:
+        recount_shows(counted, show_key)
+      db.session.commit()
+    page_cache.clear()
+
+  click.echo('%s: done, %d imported, %d rejected' % (kind, imported, rejected))
+
+@fyyur_cli.command('rollover')
+@click.option('--since-minutes', default=60, show_default=True,
+              help='Recount venues and artists with shows that started this recently.')
+@click.option('--all', 'recount_all', is_flag=True,
+              help='Recount every venue and artist instead.')
+def rollover_command(since_minutes, recount_all):
+  '''Move shows that have started from the upcoming to the past counters.
+
+  Run it from cron at least every --since-minutes; recounting is
+  idempotent, so overlapping windows are harmless.
+  '''
+  now = datetime.now()
+  for model, show_key in SHOW_COUNTERS:
+    ids = None
+    if not recount_all:
+      key = getattr(Show, show_key)
+      ids = [row[0] for row in db.session.query(key)
+                                  .filter(Show.start_time >= now - timedelta(minutes=since_minutes))
+                                  .filter(Show.start_time < now)
+                                  .distinct()]
+      if not ids:
+        continue
+    updated = recount_shows(model, show_key, ids)
+    click.echo('%s: %d recounted' % (model.__tablename__, updated))
+  db.session.commit()
+  invalidate_venue_areas()
+  page_cache.invalidate('venues', 'artists')
+
+@fyyur_cli.command('build-assets')
+def build_assets_command():
+  '''Fingerprint, bundle and precompress static/ into static/dist.
+
+  Restart the app afterwards so it picks up the new manifest.
+  '''
+  manifest = build_assets(app.static_folder, app.static_url_path)
+  click.echo('%d assets written to %s' % (len(manifest), os.path.join(app.static_folder, 'dist')))
+
+@fyyur_cli.command('compile-templates')
+@click.option('--cache-dir', help='Bytecode cache directory; TEMPLATE_CACHE_DIR by default.')
+def compile_templates_command(cache_dir):
+  '''Precompile every template into the bytecode cache.
+
+  Run it as part of a deploy, with TEMPLATE_CACHE_DIR pointing at the
+  same directory for the app, so workers start without compiling.
+  '''
+  cache_dir = cache_dir or app.config.get('TEMPLATE_CACHE_DIR')
+  if not cache_dir:
+    raise click.UsageError('set TEMPLATE_CACHE_DIR or pass --cache-dir')
+  bytecode_cache = template_bytecode_cache(cache_dir)
+  bytecode_cache.clear()
+  app.jinja_env.bytecode_cache = bytecode_cache
+  app.jinja_env.cache.clear()
+  click.echo('%d templates compiled into %s' % (load_templates(), cache_dir))
 
 #----------------------------------------------------------------------------#
 # Launch.
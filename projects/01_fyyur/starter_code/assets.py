@@ -0,0 +1,175 @@
+#----------------------------------------------------------------------------#
+# Static asset pipeline.
+#
+# 'flask fyyur build-assets' copies every file under static/ to static/dist/
+# with a content hash in its name, concatenates the BUNDLES (minifying the
+# CSS), writes .gz and, when the brotli package is installed, .br variants
+# of compressible files, and records logical name -> hashed name in
+# static/dist/manifest.json. With a manifest present, url_for('static', ...)
+# resolves to the hashed files and they are served precompressed with a
+# one-year immutable Cache-Control, since their content never changes under
+# a given name. Without one (e.g. in development) nothing changes.
+#----------------------------------------------------------------------------#
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import request, send_from_directory, url_for
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Files loaded together by layouts/main.html, in page order.
+BUNDLES = {
+  'css/app.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                  'css/main.responsive.css', 'css/main.quickfix.css'],
+  'js/head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+  'js/app.js': ['js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js', 'js/script.js'],
+}
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.ttf', '.otf', '.eot')
+
+CSS_STRING = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def minify_css(css):
+  '''Drop comments and redundant whitespace, leaving string literals alone.'''
+  parts = CSS_STRING.split(CSS_COMMENT.sub('', css))
+  for i in range(0, len(parts), 2):
+    code = re.sub(r'\s+', ' ', parts[i])
+    code = re.sub(r'\s*([{};,])\s*', r'\1', code)
+    parts[i] = code.replace(';}', '}')
+  return ''.join(parts).strip()
+
+
+def rewrite_css_urls(css, source, manifest, url_prefix):
+  '''Point relative url()s in source at their absolute, hashed URLs.'''
+  def replace(match):
+    url = match.group(2).strip()
+    if re.match(r'^([a-z]+:|/|#)', url):
+      return match.group(0)
+    path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+    return 'url("%s/%s%s")' % (url_prefix, manifest.get(target, target), suffix)
+  return CSS_URL.sub(replace, css)
+
+
+def hashed_name(name, content):
+  root, ext = posixpath.splitext(name)
+  return '%s/%s.%s%s' % (DIST, root, hashlib.sha1(content).hexdigest()[:12], ext)
+
+
+def build_assets(static_folder, url_prefix='/static'):
+  '''Rebuild static/dist; returns the manifest.'''
+  dist = os.path.join(static_folder, DIST)
+  if os.path.isdir(dist):
+    shutil.rmtree(dist)
+
+  manifest = {}
+  for directory, subdirectories, files in os.walk(static_folder):
+    subdirectories[:] = [name for name in subdirectories if directory != static_folder or name != DIST]
+    for filename in files:
+      if filename.startswith('.'):
+        continue
+      name = os.path.relpath(os.path.join(directory, filename), static_folder).replace(os.sep, '/')
+      with open(os.path.join(directory, filename), 'rb') as source:
+        manifest[name] = _write(static_folder, name, source.read())
+
+  for bundle, members in sorted(BUNDLES.items()):
+    chunks = []
+    for member in members:
+      with open(os.path.join(static_folder, member), 'rb') as source:
+        content = source.read().decode('utf-8')
+      if bundle.endswith('.css'):
+        chunks.append(minify_css(rewrite_css_urls(content, member, manifest, url_prefix)))
+      else:
+        # The libraries are shipped minified already; the separator keeps a
+        # file without a trailing semicolon from running into the next one.
+        chunks.append(content.rstrip() + '\n;')
+    manifest[bundle] = _write(static_folder, bundle, '\n'.join(chunks).encode('utf-8'))
+
+  with open(os.path.join(dist, MANIFEST), 'w') as output:
+    json.dump(manifest, output, indent=2, sort_keys=True)
+  return manifest
+
+
+def _write(static_folder, name, content):
+  target = hashed_name(name, content)
+  path = os.path.join(static_folder, target)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, 'wb') as output:
+    output.write(content)
+  if name.endswith(COMPRESSIBLE):
+    with open(path + '.gz', 'wb') as output:
+      output.write(gzip.compress(content, 9))
+    if brotli is not None:
+      with open(path + '.br', 'wb') as output:
+        output.write(brotli.compress(content))
+  return target
+
+
+def load_manifest(static_folder):
+  path = os.path.join(static_folder, DIST, MANIFEST)
+  if not os.path.exists(path):
+    return None
+  with open(path) as manifest:
+    return json.load(manifest)
+
+
+class Assets(object):
+  '''Resolves static URLs through the manifest and serves the built files.'''
+
+  def __init__(self, app=None):
+    self.manifest = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    self.manifest = load_manifest(app.static_folder)
+    app.jinja_env.globals['bundle_urls'] = self.bundle_urls
+    if self.manifest is None:
+      return
+    app.url_defaults(self._hashed_filename)
+    app.view_functions['static'] = self.send_static_file
+
+  def bundle_urls(self, bundle):
+    '''URLs to include for bundle: the bundle itself once built, else its members.'''
+    if self.manifest is not None and bundle in self.manifest:
+      return [url_for('static', filename=bundle)]
+    return [url_for('static', filename=member) for member in BUNDLES[bundle]]
+
+  def _hashed_filename(self, endpoint, values):
+    if endpoint == 'static' and values.get('filename') in self.manifest:
+      values['filename'] = self.manifest[values['filename']]
+
+  def send_static_file(self, filename):
+    if not filename.startswith(DIST + '/'):
+      return self.app.send_static_file(filename)
+
+    accepted = request.accept_encodings
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, extension in (('br', '.br'), ('gzip', '.gz')):
+      if accepted[encoding] and os.path.exists(os.path.join(self.app.static_folder, filename + extension)):
+        response = send_from_directory(self.app.static_folder, filename + extension, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        break
+    else:
+      response = send_from_directory(self.app.static_folder, filename, mimetype=mimetype)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,111 @@
+#----------------------------------------------------------------------------#
+# Name autocomplete.
+#
+# Every word of every venue and artist name is kept in one sorted list of
+# (kind, word, name, id) keys, so the names with a word starting with a
+# prefix are a contiguous run found with bisect: a lookup costs
+# O(log n + k) however many names there are. Writers update the list in
+# place under a lock, at O(log n) to find each key plus the shift. Readers
+# take no lock: a search racing a write may miss or repeat a neighbouring
+# key, which only costs that one suggestion.
+#----------------------------------------------------------------------------#
+
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(text):
+  return text.casefold()
+
+
+def _keys(kind, entity_id, name):
+  folded = fold(name)
+  return set((kind, word, folded, entity_id) for word in WORD.findall(folded))
+
+
+def _delete(keys, stale):
+  for key in stale:
+    i = bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+      del keys[i]
+
+
+class PrefixIndex(object):
+
+  def __init__(self, max_age=None):
+    # Rebuild from the database once the index is older than max_age
+    # seconds, to pick up writes made by other worker processes.
+    self.max_age = max_age
+    self._keys = []
+    self._names = {}
+    self._built = None
+    self._lock = threading.Lock()
+
+  def is_stale(self):
+    if self._built is None:
+      return True
+    return self.max_age is not None and time.monotonic() - self._built > self.max_age
+
+  def build(self, entries):
+    '''Replace the index with entries of (kind, id, name).'''
+    names = {}
+    keys = set()
+    for kind, entity_id, name in entries:
+      names[kind, entity_id] = name
+      keys |= _keys(kind, entity_id, name)
+    with self._lock:
+      self._keys = sorted(keys)
+      self._names = names
+      self._built = time.monotonic()
+
+  def invalidate(self):
+    with self._lock:
+      self._built = None
+
+  def put(self, kind, entity_id, name):
+    '''Add or rename one entry.'''
+    with self._lock:
+      old = self._names.get((kind, entity_id))
+      self._names[kind, entity_id] = name
+      if old is not None:
+        _delete(self._keys, _keys(kind, entity_id, old))
+      for key in _keys(kind, entity_id, name):
+        insort(self._keys, key)
+
+  def remove(self, kind, entity_id):
+    with self._lock:
+      old = self._names.get((kind, entity_id))
+      if old is None:
+        return
+      _delete(self._keys, _keys(kind, entity_id, old))
+      del self._names[kind, entity_id]
+
+  def search(self, kind, prefix, limit=10):
+    '''
+    Up to limit (id, name) of kind with a word starting with prefix,
+    ordered by the matching word, then by name.
+    '''
+    prefix = fold(prefix.strip())
+    if not prefix:
+      return []
+    keys, names = self._keys, self._names
+    results = []
+    seen = set()
+    i = bisect_left(keys, (kind, prefix))
+    while len(results) < limit:
+      try:
+        key_kind, word, _, entity_id = keys[i]
+      except IndexError:
+        break
+      if key_kind != kind or not word.startswith(prefix):
+        break
+      name = names.get((kind, entity_id))
+      if name is not None and entity_id not in seen:
+        seen.add(entity_id)
+        results.append((entity_id, name))
+      i += 1
+    return results
@@ -0,0 +1,61 @@
+'''
+Benchmark for /autocomplete name lookups.
+
+Builds the prefix index over --sizes random three-word names and times
+lookups for one- to three-letter prefixes (shorter prefixes match more
+names, so they are the slowest case for a scan) and single-name updates,
+which insert into the index in place.
+
+    python benchmarks/bench_autocomplete.py [--sizes 1000,10000,100000] [--lookups 10000]
+'''
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autocomplete import PrefixIndex
+
+
+def random_name(rng):
+  return ' '.join(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+                  for _ in range(3))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--sizes', default='1000,10000,100000')
+  parser.add_argument('--lookups', type=int, default=10000)
+  args = parser.parse_args()
+
+  rng = random.Random(0)
+  print('%10s %10s %12s %12s %12s %12s' % ('names', 'build', '1 letter', '2 letters', '3 letters', 'update'))
+  for size in [int(size) for size in args.sizes.split(',')]:
+    index = PrefixIndex()
+    start = time.perf_counter()
+    index.build(('venue', i, random_name(rng)) for i in range(size))
+    build = time.perf_counter() - start
+
+    timings = []
+    for length in (1, 2, 3):
+      prefixes = [''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+                  for _ in range(args.lookups)]
+      start = time.perf_counter()
+      for prefix in prefixes:
+        index.search('venue', prefix, 10)
+      timings.append((time.perf_counter() - start) / args.lookups * 1e6)
+
+    updates = 20
+    start = time.perf_counter()
+    for i in range(updates):
+      index.put('venue', rng.randrange(size), random_name(rng))
+    update = (time.perf_counter() - start) / updates * 1000
+
+    print('%10d %8.0fms %10.1fus %10.1fus %10.1fus %10.2fms' % ((size, build * 1000) + tuple(timings) + (update,)))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,59 @@
+'''
+Micro-benchmark for the datetime template filter.
+
+Formats a /shows-sized batch of start times with the previous filter
+(babel.dates.format_datetime with a pattern string) and with
+formatting.format_datetime, checks that both produce the same strings, and
+reports the time per call.
+
+    python benchmarks/bench_datetime_filter.py [--rows 5000] [--distinct 500]
+'''
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import babel.dates
+
+import formatting
+
+
+def legacy_format_datetime(value, format='medium'):
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(value, format,locale='en_US')
+
+
+def run(fn, values, format):
+  start = time.perf_counter()
+  output = [fn(value, format) for value in values]
+  return output, (time.perf_counter() - start) * 1e6 / len(values)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--rows', type=int, default=5000)
+  parser.add_argument('--distinct', type=int, default=500,
+                      help='number of distinct start times among the rows')
+  args = parser.parse_args()
+
+  base = datetime(2026, 10, 18, 20, 0)
+  values = [base + timedelta(hours=i % args.distinct) for i in range(args.rows)]
+
+  for format in ('full', 'medium'):
+    formatting.format_datetime.cache_clear()
+    expected, legacy = run(legacy_format_datetime, values, format)
+    cold, first = run(formatting.format_datetime, values, format)
+    warm, repeat = run(formatting.format_datetime, values, format)
+    assert expected == cold == warm
+    print('%-6s before=%7.2fus/call  after(first render)=%6.2fus/call  after(repeat)=%5.2fus/call' % (
+      format, legacy, first, repeat))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,98 @@
+'''
+Benchmark for first-request latency after a worker starts.
+
+Clears the Jinja environment's template cache to simulate a fresh worker and
+times the first request to each route: compiling templates from source
+(before), loading them from a bytecode cache filled by
+'flask fyyur compile-templates' (bytecode), and with the bytecode cache plus
+PRELOAD_TEMPLATES, where loading happens at startup instead (preload; the
+startup cost is reported separately).
+
+    python benchmarks/bench_template_startup.py [--runs 20]
+
+Uses an in-memory SQLite database with a handful of rows, so the timings are
+dominated by template loading and rendering.
+'''
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, page_cache, Venue, Artist, Show, load_templates, template_bytecode_cache
+
+ROUTES = ['/', '/venues', '/venues/1', '/venues/create', '/artists', '/artists/1',
+          '/artists/1/edit', '/shows', '/shows/create']
+
+
+def seed():
+  db.create_all()
+  db.session.add(Venue(name='Venue', city='City', state='NY', seeking_talent=False))
+  db.session.add(Artist(name='Artist', city='City', state='NY', genres=['Jazz'], seeking_venue=False))
+  db.session.commit()
+  now = datetime.now()
+  db.session.add_all([Show(venue_id=1, artist_id=1, start_time=now + timedelta(days=days))
+                      for days in (-2, 2)])
+  db.session.commit()
+
+
+def first_requests(client, bytecode_cache, preload):
+  app.jinja_env.cache.clear()
+  app.jinja_env.bytecode_cache = bytecode_cache
+  startup = 0.0
+  if preload:
+    start = time.perf_counter()
+    load_templates()
+    startup = (time.perf_counter() - start) * 1000
+
+  timings = {}
+  for route in ROUTES:
+    start = time.perf_counter()
+    response = client.get(route)
+    timings[route] = (time.perf_counter() - start) * 1000
+    assert response.status_code == 200, (route, response.status_code)
+  return startup, timings
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--runs', type=int, default=20)
+  args = parser.parse_args()
+
+  app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+  page_cache.enabled = False
+  cache_dir = tempfile.mkdtemp(prefix='fyyur-jinja-')
+  with app.app_context():
+    seed()
+    client = app.test_client()
+    # Warm everything except template loading: imports, the database, babel.
+    first_requests(client, None, False)
+
+    bytecode_cache = template_bytecode_cache(cache_dir)
+    app.jinja_env.bytecode_cache = bytecode_cache
+    app.jinja_env.cache.clear()
+    load_templates()
+
+    modes = (('before', None, False), ('bytecode', bytecode_cache, False),
+             ('preload', bytecode_cache, True))
+    results = {}
+    for name, cache, preload in modes:
+      runs = [first_requests(client, cache, preload) for _ in range(args.runs)]
+      results[name] = (statistics.median(startup for startup, _ in runs),
+                       dict((route, statistics.median(timings[route] for _, timings in runs))
+                            for route in ROUTES))
+
+  print('%-16s' % 'route' + ''.join('%12s' % name for name, _, _ in modes))
+  print('%-16s' % '(startup)' + ''.join('%10.2fms' % results[name][0] for name, _, _ in modes))
+  for route in ROUTES:
+    print('%-16s' % route + ''.join('%10.2fms' % results[name][1][route] for name, _, _ in modes))
+  print('%-16s' % 'total' + ''.join('%10.2fms' % (results[name][0] + sum(results[name][1].values()))
+                                    for name, _, _ in modes))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,106 @@
+'''
+Benchmark for the /venues area listing.
+
+Seeds 10k venues across 500 (city, state) areas and compares the old
+one-query-per-area listing with load_venue_areas(), both cold (cache just
+invalidated) and warm (served from the in-process cache).
+
+    python benchmarks/bench_venues.py [--database-url sqlite://] [--runs 50]
+
+By default an in-memory SQLite database is used; pass a Postgres URL to
+measure against a real server (the Venue table is created if missing).
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app, db, Venue, load_venue_areas, invalidate_venue_areas
+
+VENUES = 10000
+AREAS = 500
+
+
+def legacy_venue_areas():
+  data = []
+  areas = Venue.query\
+              .with_entities(Venue.city, Venue.state)\
+              .group_by(Venue.city, Venue.state)\
+              .all()
+  for area in areas:
+    venue = Venue.query\
+              .with_entities(Venue.id, Venue.name)\
+              .filter(Venue.city == area.city)\
+              .filter(Venue.state == area.state)\
+              .all()
+    data.append({"city": area.city, "state": area.state, "venues": venue})
+  return data
+
+
+def cold_venue_areas():
+  invalidate_venue_areas()
+  return load_venue_areas()
+
+
+def seed():
+  Venue.__table__.create(db.engine, checkfirst=True)
+  if Venue.query.count() >= VENUES:
+    return
+  rows = [{
+    'name': 'Venue %d' % i,
+    'city': 'City %d' % (i % AREAS),
+    'state': 'S%d' % (i % 50),
+    'seeking_talent': False,
+  } for i in range(VENUES)]
+  db.session.execute(Venue.__table__.insert(), rows)
+  db.session.commit()
+
+
+def measure(fn, runs):
+  statements = []
+
+  def count_statement(*args):
+    statements.append(args[2])
+
+  event.listen(db.engine, 'before_cursor_execute', count_statement)
+  timings = []
+  try:
+    for _ in range(runs):
+      del statements[:]
+      start = time.perf_counter()
+      fn()
+      timings.append((time.perf_counter() - start) * 1000)
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', count_statement)
+  return len(statements), timings
+
+
+def report(name, queries, timings):
+  p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+  print('%-8s queries/request=%-5d median=%8.2fms p95=%8.2fms' % (
+    name, queries, statistics.median(timings), p95))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--database-url', default='sqlite://')
+  parser.add_argument('--runs', type=int, default=50)
+  args = parser.parse_args()
+
+  app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+  with app.app_context():
+    seed()
+    for name, fn in (('before', legacy_venue_areas),
+                     ('cold', cold_venue_areas),
+                     ('warm', load_venue_areas)):
+      queries, timings = measure(fn, args.runs)
+      report(name, queries, timings)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,142 @@
+'''
+Load test for connection pool sizing.
+
+Serves the app from a threaded server in this process and has --users
+concurrent clients each make --requests requests over a mix of read routes
+and searches, with the page cache off so every request reaches the
+database. Reports throughput, latency percentiles, errors, and the most
+connections the pool ever had checked out against its pool_size +
+max_overflow limit; requests that cannot get a connection within
+pool_timeout fail with a 500 and show up as errors.
+
+    python benchmarks/load_test.py [--database-url URL] [--users 200] [--requests 20]
+
+The database defaults to SQLALCHEMY_DATABASE_URI (set DATABASE_URL and the
+DB_POOL_* variables as in production). Tables are created and seeded with a
+few rows when empty.
+'''
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from werkzeug.serving import make_server
+
+from app import app, db, page_cache, Venue, Artist, Show
+
+READS = ['/venues', '/artists', '/shows', '/venues/{venue_id}', '/artists/{artist_id}']
+SEARCHES = ['/venues/search', '/artists/search']
+
+
+class PoolWatcher(object):
+  '''Tracks how many connections are checked out of engine's pool.'''
+
+  def __init__(self, engine):
+    self.checked_out = 0
+    self.peak = 0
+    self._lock = threading.Lock()
+    event.listen(engine, 'checkout', self.checkout)
+    event.listen(engine, 'checkin', self.checkin)
+
+  def checkout(self, *args):
+    with self._lock:
+      self.checked_out += 1
+      self.peak = max(self.peak, self.checked_out)
+
+  def checkin(self, *args):
+    with self._lock:
+      self.checked_out -= 1
+
+
+def seed():
+  db.create_all()
+  if Venue.query.first() is not None:
+    return
+  db.session.add_all([Venue(name='Venue %d' % i, city='City', state='NY', seeking_talent=False)
+                      for i in range(20)])
+  db.session.add_all([Artist(name='Artist %d' % i, city='City', state='NY', genres=['Jazz'],
+                             seeking_venue=False) for i in range(20)])
+  db.session.commit()
+  now = datetime.now()
+  db.session.add_all([Show(venue_id=i % 20 + 1, artist_id=i % 20 + 1,
+                           start_time=now + timedelta(days=i - 50))
+                      for i in range(100)])
+  db.session.commit()
+
+
+def user(base_url, requests, seed):
+  rng = random.Random(seed)
+  results = []
+  for _ in range(requests):
+    if rng.random() < 0.2:
+      path, data = rng.choice(SEARCHES), urllib.parse.urlencode({'search_term': 'Venue 1'}).encode()
+    else:
+      path, data = rng.choice(READS).format(venue_id=rng.randint(1, 20), artist_id=rng.randint(1, 20)), None
+    start = time.perf_counter()
+    try:
+      with urllib.request.urlopen(base_url + path, data=data, timeout=60) as response:
+        response.read()
+        status = response.status
+    except urllib.error.HTTPError as e:
+      status = e.code
+    except (urllib.error.URLError, OSError):
+      status = None
+    results.append((status, (time.perf_counter() - start) * 1000))
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--database-url', default=app.config['SQLALCHEMY_DATABASE_URI'])
+  parser.add_argument('--users', type=int, default=200)
+  parser.add_argument('--requests', type=int, default=20, help='requests per user')
+  args = parser.parse_args()
+
+  app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+  page_cache.enabled = False
+  with app.app_context():
+    seed()
+    watcher = PoolWatcher(db.engine)
+    pool = db.engine.pool
+    limit = pool.size() + pool._max_overflow if hasattr(pool, 'size') else None
+
+  logging.getLogger('werkzeug').setLevel(logging.ERROR)
+  server = make_server('127.0.0.1', 0, app, threaded=True)
+  server.socket.listen(args.users)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  base_url = 'http://127.0.0.1:%d' % server.server_port
+
+  started = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=args.users) as executor:
+    futures = [executor.submit(user, base_url, args.requests, i) for i in range(args.users)]
+    results = [result for future in futures for result in future.result()]
+  elapsed = time.perf_counter() - started
+  server.shutdown()
+
+  timings = sorted(duration for _, duration in results)
+  errors = [status for status, _ in results if status != 200]
+  print('%d users x %d requests in %.1fs: %.0f req/s' % (
+    args.users, args.requests, elapsed, len(results) / elapsed))
+  print('latency median=%.1fms p95=%.1fms p99=%.1fms max=%.1fms' % (
+    statistics.median(timings), timings[int(len(timings) * 0.95)],
+    timings[int(len(timings) * 0.99)], timings[-1]))
+  print('errors: %d %s' % (len(errors), sorted(set(errors), key=str) if errors else ''))
+  print('pool: %s, peak checked out %d%s' % (
+    pool.__class__.__name__, watcher.peak, ' of %d' % limit if limit is not None else ''))
+  return 1 if errors else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,235 @@
+#----------------------------------------------------------------------------#
+# Rendered page cache.
+#
+# Pages are stored under their path and query string together with the tags
+# of the records they show ('venue:3', 'shows', ...). The write handlers
+# invalidate tags, which drops exactly the pages that displayed that data.
+# Entries also expire after a TTL, which bounds how long a page can miss
+# purely time-based changes such as an upcoming show becoming a past one.
+#----------------------------------------------------------------------------#
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, make_response, request, session
+
+
+class CacheBackend(object):
+  '''Storage used by ResponseCache; values are opaque to the backend.'''
+
+  def get(self, key):
+    raise NotImplementedError
+
+  def set(self, key, value, ttl, tags=()):
+    raise NotImplementedError
+
+  def invalidate_tag(self, tag):
+    '''Drop every entry stored with tag; returns how many were dropped.'''
+    raise NotImplementedError
+
+  def clear(self):
+    raise NotImplementedError
+
+  def __len__(self):
+    return 0
+
+
+class LRUCache(CacheBackend):
+  '''In-process LRU with per-entry expiry, safe to share between threads.'''
+
+  def __init__(self, max_entries=1024):
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    self._tags = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      value, expires, tags = entry
+      if expires < time.monotonic():
+        self._remove(key)
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl, tags=()):
+    with self._lock:
+      if key in self._entries:
+        self._remove(key)
+      self._entries[key] = (value, time.monotonic() + ttl, tuple(tags))
+      for tag in tags:
+        self._tags.setdefault(tag, set()).add(key)
+      while len(self._entries) > self.max_entries:
+        self._remove(next(iter(self._entries)))
+
+  def invalidate_tag(self, tag):
+    with self._lock:
+      keys = self._tags.pop(tag, ())
+      for key in keys:
+        self._remove(key)
+      return len(keys)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._tags.clear()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def _remove(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is None:
+      return
+    for tag in entry[2]:
+      keys = self._tags.get(tag)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self._tags[tag]
+
+
+# Adds a key to a tag's set and keeps the set at least as long as the
+# entry, so sets of rarely invalidated tags expire with their entries
+# instead of growing forever.
+TAG_ENTRY = '''
+redis.call('SADD', KEYS[1], ARGV[1])
+if redis.call('TTL', KEYS[1]) < tonumber(ARGV[2]) then
+  redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+'''
+
+
+class RedisCache(CacheBackend):
+  '''
+  Backend for a Redis client (or anything with the same get/set/delete,
+  set-type and scripting commands), so the cache can be shared between
+  workers.
+  '''
+
+  def __init__(self, client, prefix='fyyur:page:'):
+    self.client = client
+    self.prefix = prefix
+    self._tag_entry = client.register_script(TAG_ENTRY)
+
+  def get(self, key):
+    value = self.client.get(self.prefix + key)
+    return pickle.loads(value) if value is not None else None
+
+  def set(self, key, value, ttl, tags=()):
+    ttl = max(int(ttl), 1)
+    self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+    for tag in tags:
+      self._tag_entry(keys=[self.prefix + 'tag:' + tag], args=[key, ttl])
+
+  def invalidate_tag(self, tag):
+    tag_key = self.prefix + 'tag:' + tag
+    keys = [key.decode('utf-8') if isinstance(key, bytes) else key
+            for key in self.client.smembers(tag_key)]
+    if keys:
+      self.client.delete(*[self.prefix + key for key in keys])
+    self.client.delete(tag_key)
+    return len(keys)
+
+  def clear(self):
+    keys = list(self.client.scan_iter(self.prefix + '*'))
+    if keys:
+      self.client.delete(*keys)
+
+  def __len__(self):
+    # Scans the keyspace, which is fine for /_debug/cache but not for
+    # anything on the request path.
+    tag_prefix = (self.prefix + 'tag:').encode('utf-8')
+    return sum(1 for key in self.client.scan_iter(self.prefix + '*')
+               if not (key if isinstance(key, bytes) else key.encode('utf-8')).startswith(tag_prefix))
+
+
+class ResponseCache(object):
+  '''Caches full GET responses of the views decorated with cached().'''
+
+  def __init__(self, backend=None, ttl=300, enabled=True, vary=None):
+    self.backend = backend if backend is not None else LRUCache()
+    self.ttl = ttl
+    self.enabled = enabled
+    # Optional callable whose result is added to the key, for request
+    # properties other than the URL that change the rendered page.
+    self.vary = vary
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+
+  def cached(self, *tags):
+    '''
+    Cache the decorated view. tags may contain format strings filled in
+    from the view arguments, e.g. 'venue:{venue_id}'.
+    '''
+    def decorator(view):
+      @wraps(view)
+      def wrapper(**kwargs):
+        # Pending flash messages are rendered into the page, so it is
+        # neither served from nor stored in the cache.
+        if not self.enabled or request.method != 'GET' or session.get('_flashes'):
+          return view(**kwargs)
+
+        key = request.full_path
+        if self.vary is not None:
+          key += '|' + str(self.vary())
+        # Set by views that know the version of the data they render.
+        if g.get('page_cache_version'):
+          key += '|' + g.page_cache_version
+        # Set by views that must render fresh data, e.g. for a user who
+        # has to see their own writes; the page still refreshes the cache.
+        entry = None if g.get('page_cache_refresh') else self.backend.get(key)
+        if entry is not None:
+          self.hits += 1
+          body, status, headers = entry
+          response = Response(body, status, headers)
+          response.headers['X-Cache'] = 'HIT'
+          return response
+
+        self.misses += 1
+        g.page_cache_tags = set(tag.format(**kwargs) for tag in tags)
+        response = make_response(view(**kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+          headers = [(name, value) for name, value in response.headers
+                     if name in ('Content-Type',)]
+          # Set by views whose data may already be out of date, to keep
+          # the page for less than the usual TTL.
+          ttl = g.get('page_cache_ttl') or self.ttl
+          self.backend.set(key, (response.get_data(), response.status_code, headers),
+                           ttl, g.page_cache_tags)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+      return wrapper
+    return decorator
+
+  def tag(self, *tags):
+    '''Tag the page being cached with the records it displays.'''
+    page_tags = g.get('page_cache_tags')
+    if page_tags is not None:
+      page_tags.update(tags)
+
+  def invalidate(self, *tags):
+    for tag in tags:
+      self.invalidations += 1
+      self.backend.invalidate_tag(tag)
+
+  def clear(self):
+    self.invalidations += 1
+    self.backend.clear()
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+      'invalidations': self.invalidations,
+      'entries': len(self.backend),
+    }
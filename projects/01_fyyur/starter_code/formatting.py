@@ -0,0 +1,45 @@
+#----------------------------------------------------------------------------#
+# Date formatting for templates.
+#
+# babel.dates.format_datetime resolves the locale and parses the pattern on
+# every call, which adds up on pages that format thousands of show times.
+# Here both are resolved once, and the formatted strings themselves are
+# memoized since the same start times repeat across pages and requests.
+#----------------------------------------------------------------------------#
+
+from datetime import timezone
+from functools import lru_cache
+
+from babel import Locale
+from babel.dates import parse_pattern
+
+DEFAULT_LOCALE = 'en_US'
+
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+FORMATTED_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format):
+  return parse_pattern(DATETIME_FORMATS.get(format, format))
+
+
+@lru_cache(maxsize=None)
+def parsed_locale(locale):
+  return Locale.parse(locale)
+
+
+@lru_cache(maxsize=FORMATTED_CACHE_SIZE)
+def format_datetime(value, format='medium', locale=DEFAULT_LOCALE):
+  '''
+  Format value with one of DATETIME_FORMATS (or a raw babel pattern) for
+  locale; same output as babel.dates.format_datetime with that pattern.
+  '''
+  if value.tzinfo is None:
+    # babel treats naive datetimes as UTC as well.
+    value = value.replace(tzinfo=timezone.utc)
+  return compiled_pattern(format).apply(value, parsed_locale(locale))
@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField,BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField,BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional
+from scheduling import SHOW_DURATION
 
 genreChoices = [
             ('Alternative', 'Alternative'),
@@ -79,17 +80,33 @@ stateChoices = [
         ]
 
 class ShowForm(Form):
-    artist_id = StringField(
-        'artist_id'
+    artist_id = IntegerField(
+        'artist_id',
+        validators=[DataRequired()]
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = IntegerField(
+        'venue_id',
+        validators=[DataRequired()]
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
         default= datetime.today()
     )
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
+
+    def validate(self):
+        if not super(ShowForm, self).validate():
+            return False
+        if self.end_time.data is None:
+            self.end_time.data = self.start_time.data + SHOW_DURATION
+        elif self.end_time.data <= self.start_time.data:
+            self.end_time.errors.append('End time must be after the start time.')
+            return False
+        return True
 
 class VenueForm(Form):
     name = StringField(
@@ -99,7 +116,7 @@ class VenueForm(Form):
         'city', validators=[DataRequired()]
     )
     state = SelectField(
-        'state', validators=[DataRequired(),AnyOf(stateChoices)],
+        'state', validators=[DataRequired(),AnyOf([value for value, label in stateChoices])],
         choices=stateChoices
     )
     address = StringField(
@@ -133,7 +150,7 @@ class ArtistForm(Form):
         'city', validators=[DataRequired()]
     )
     state = SelectField(
-        'state', validators=[DataRequired(),AnyOf(stateChoices)],
+        'state', validators=[DataRequired(),AnyOf([value for value, label in stateChoices])],
         choices=stateChoices
     )
     phone = StringField(
@@ -143,7 +160,7 @@ class ArtistForm(Form):
         'image_link'
     )
     genres = SelectMultipleField(
-        'genres', validators=[DataRequired(),AnyOf(values=genreChoices)],
+        'genres', validators=[DataRequired()],
         choices= genreChoices
     )
     facebook_link = StringField(
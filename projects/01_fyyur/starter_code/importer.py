@@ -0,0 +1,206 @@
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows.
+#
+# Rows are streamed from CSV or JSON Lines, validated with the same WTForms
+# classes the HTML forms use, and written in batches: COPY on Postgres,
+# executemany elsewhere, with one commit per batch. Shows are also checked
+# for double bookings, against the database and the rows still waiting in
+# the batch.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import time
+
+from sqlalchemy import Integer
+from werkzeug.datastructures import MultiDict
+from wtforms.fields import BooleanField, SelectMultipleField
+
+from scheduling import find_conflicts
+
+BATCH_SIZE = 1000
+TRUE_VALUES = ('y', 'yes', 'true', 't', '1', 'on')
+
+
+class UnreadableRow(object):
+  '''Stands in for a row that could not be parsed; import_rows rejects it.'''
+
+  def __init__(self, errors):
+    self.errors = errors
+
+
+def read_rows(stream, fmt):
+  '''
+  Yield (line number, row dict) pairs from a CSV or JSON Lines stream, with
+  an UnreadableRow in place of a line that is not a JSON object.
+  '''
+  if fmt == 'csv':
+    reader = csv.DictReader(stream)
+    for row in reader:
+      yield reader.line_num, row
+  else:
+    for line_num, line in enumerate(stream, 1):
+      if not line.strip():
+        continue
+      try:
+        row = json.loads(line)
+      except ValueError as e:
+        yield line_num, UnreadableRow({'line': ['Not valid JSON: %s' % e]})
+        continue
+      if not isinstance(row, dict):
+        yield line_num, UnreadableRow({'line': ['Not a JSON object.']})
+        continue
+      yield line_num, row
+
+
+def _formdata(form_class, row):
+  formdata = MultiDict()
+  for name, value in row.items():
+    unbound = getattr(form_class, name, None)
+    field_class = getattr(unbound, 'field_class', None)
+    if value is None or field_class is None:
+      continue
+    if field_class is SelectMultipleField:
+      values = value.split(';') if isinstance(value, str) else value
+      for item in values:
+        if str(item).strip():
+          formdata.add(name, str(item).strip())
+    elif field_class is BooleanField:
+      # BooleanField treats any non-empty string as checked, so 'n' has to go.
+      if value is True or str(value).strip().lower() in TRUE_VALUES:
+        formdata.add(name, 'y')
+    else:
+      formdata.add(name, str(value))
+  return formdata
+
+
+def validate_row(form_class, table, row):
+  '''
+  Validate row with form_class; returns (values, errors) where values maps
+  table column names to the converted form data.
+  '''
+  form = form_class(formdata=_formdata(form_class, row), meta={'csrf': False})
+  if not form.validate():
+    return None, form.errors
+
+  values = {}
+  for name, value in form.data.items():
+    if name not in table.c:
+      continue
+    if value is not None and isinstance(table.c[name].type, Integer):
+      try:
+        value = int(value)
+      except ValueError:
+        return None, {name: ['Not a valid integer.']}
+    values[name] = value
+  return values, None
+
+
+class BookingCheck(object):
+  '''
+  Rejects show rows that overlap another show at the same venue or by the
+  same artist, for import_rows' check.
+  '''
+
+  def __init__(self, session, show):
+    self.session = session
+    self.show = show
+    self._batch = None
+    self._booked = {}
+
+  def __call__(self, line_num, values, batch):
+    if batch is not self._batch:
+      # Rows of earlier batches are committed and found in the database.
+      self._batch = batch
+      self._booked = {}
+    start, end = values['start_time'], values['end_time']
+    errors = []
+    for conflict in find_conflicts(self.session, self.show, start, end,
+                                   venue_id=values['venue_id'], artist_id=values['artist_id']):
+      errors.append('Conflicts with show %d (%s to %s) %s.' % (
+        conflict.id, conflict.start_time, conflict.end_time,
+        'at this venue' if conflict.venue_id == values['venue_id'] else 'by this artist'))
+    reported = set()
+    for column, where in (('venue_id', 'at this venue'), ('artist_id', 'by this artist')):
+      for booked_line, booked_start, booked_end in self._booked.get((column, values[column]), ()):
+        if booked_start < end and booked_end > start and booked_line not in reported:
+          reported.add(booked_line)
+          errors.append('Conflicts with line %d (%s to %s) %s.' % (
+            booked_line, booked_start, booked_end, where))
+    if errors:
+      return {'start_time': errors}
+
+    for column in ('venue_id', 'artist_id'):
+      self._booked.setdefault((column, values[column]), []).append((line_num, start, end))
+    return None
+
+
+def _copy_value(value):
+  if isinstance(value, bool):
+    return 't' if value else 'f'
+  if isinstance(value, (list, tuple)):
+    return '{' + ','.join('"%s"' % item.replace('\\', '\\\\').replace('"', '\\"') for item in value) + '}'
+  return value
+
+
+def insert_batch(session, table, batch):
+  '''Insert a batch of column dicts in the session's transaction.'''
+  bind = session.get_bind()
+  if bind.dialect.name != 'postgresql':
+    session.execute(table.insert(), batch)
+    return
+
+  columns = list(batch[0])
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for values in batch:
+    writer.writerow([_copy_value(values[column]) for column in columns])
+  buffer.seek(0)
+
+  cursor = session.connection().connection.cursor()
+  cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (
+    table.name, ', '.join('"%s"' % column for column in columns)), buffer)
+
+
+def import_rows(session, table, form_class, rows, batch_size=BATCH_SIZE,
+                on_batch=None, on_reject=None, check=None):
+  '''
+  Validate and insert rows, committing every batch_size valid rows.
+
+  on_batch(imported, elapsed) is called after each commit and
+  on_reject(line_num, errors) for each invalid row. check(line_num,
+  values, batch), if given, is called for each row that passed validation
+  with the rows waiting in the current batch, and returns errors to reject
+  it or None. Returns (imported, rejected).
+  '''
+  started = time.perf_counter()
+  imported = rejected = 0
+  batch = []
+
+  def flush():
+    insert_batch(session, table, batch)
+    session.commit()
+    if on_batch:
+      on_batch(imported + len(batch), time.perf_counter() - started)
+    return len(batch)
+
+  for line_num, row in rows:
+    if isinstance(row, UnreadableRow):
+      values, errors = None, row.errors
+    else:
+      values, errors = validate_row(form_class, table, row)
+      if not errors and check is not None:
+        errors = check(line_num, values, batch)
+    if errors:
+      rejected += 1
+      if on_reject:
+        on_reject(line_num, errors)
+      continue
+    batch.append(values)
+    if len(batch) >= batch_size:
+      imported += flush()
+      batch = []
+  if batch:
+    imported += flush()
+  return imported, rejected
@@ -0,0 +1,144 @@
+#----------------------------------------------------------------------------#
+# Application logging.
+#
+# Request threads only put records on a bounded in-memory queue; a
+# QueueListener thread formats them as JSON lines and appends them to the
+# log file. Several worker processes share that file, which only appends
+# are safe for, so it is rotated externally (logrotate and the like) and a
+# WatchedFileHandler reopens it after a move. When the queue is full a
+# record is dropped and counted rather than blocking the request, and the
+# number dropped is logged once there is room again.
+#----------------------------------------------------------------------------#
+
+import atexit
+import json
+import logging
+import queue
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# Attributes every LogRecord has; anything else was passed with extra=.
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+# Incoming X-Request-ID values are used only if they look like an id;
+# anything else is replaced so it can't bloat or forge log lines.
+REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+
+class JSONFormatter(logging.Formatter):
+  '''One JSON object per line, with any extra= fields at the top level.'''
+
+  def format(self, record):
+    entry = {
+      'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+      'level': record.levelname,
+      'logger': record.name,
+      'message': record.getMessage(),
+    }
+    for name, value in vars(record).items():
+      if name not in RECORD_ATTRIBUTES:
+        entry[name] = value
+    if record.exc_info and not record.exc_text:
+      record.exc_text = self.formatException(record.exc_info)
+    if record.exc_text:
+      entry['exception'] = record.exc_text
+    return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+  '''Stamp records logged during a request with its correlation id.'''
+
+  def filter(self, record):
+    if has_request_context() and not hasattr(record, 'request_id'):
+      record.request_id = g.get('request_id')
+    return True
+
+
+class DroppingQueueHandler(QueueHandler):
+  '''QueueHandler that drops and counts records instead of blocking.'''
+
+  def __init__(self, maxsize):
+    super(DroppingQueueHandler, self).__init__(queue.Queue(maxsize))
+    self.dropped = 0
+    self._unreported = 0
+    self._lock = threading.Lock()
+
+  def prepare(self, record):
+    # Resolve the message and traceback before queueing, so the
+    # record no longer references request objects once it is queued.
+    record = logging.makeLogRecord(vars(record))
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    return record
+
+  def enqueue(self, record):
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      with self._lock:
+        self.dropped += 1
+        self._unreported += 1
+      return
+
+    if self._unreported:
+      with self._lock:
+        unreported, self._unreported = self._unreported, 0
+      if unreported:
+        notice = logging.makeLogRecord({
+          'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+          'msg': 'dropped %d log records, the log queue was full' % unreported,
+        })
+        try:
+          self.queue.put_nowait(notice)
+        except queue.Full:
+          with self._lock:
+            self._unreported += unreported
+
+
+def setup_logging(app):
+  '''
+  Send app.logger through a bounded queue to a JSON log file and log one
+  line per request with its id, status and duration.
+  '''
+  file_handler = WatchedFileHandler(app.config.get('LOG_FILE', 'error.log'))
+  file_handler.setFormatter(JSONFormatter())
+
+  handler = DroppingQueueHandler(app.config.get('LOG_QUEUE_SIZE', 10000))
+  handler.addFilter(RequestContextFilter())
+  listener = QueueListener(handler.queue, file_handler)
+  listener.start()
+  atexit.register(listener.stop)
+
+  app.logger.setLevel(app.config.get('LOG_LEVEL', logging.INFO))
+  app.logger.removeHandler(default_handler)
+  app.logger.addHandler(handler)
+
+  @app.before_request
+  def start_request_log():
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if REQUEST_ID.match(request_id) else uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+
+  @app.after_request
+  def finish_request_log(response):
+    started = g.get('request_started')
+    if started is not None:
+      response.headers['X-Request-ID'] = g.request_id
+      app.logger.info('%s %s %s', request.method, request.full_path.rstrip('?'), response.status_code,
+                      extra={'method': request.method,
+                             'path': request.path,
+                             'status': response.status_code,
+                             'duration_ms': round((time.perf_counter() - started) * 1000, 2)})
+    return response
+
+  return handler
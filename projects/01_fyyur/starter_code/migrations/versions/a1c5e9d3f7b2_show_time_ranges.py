@@ -0,0 +1,61 @@
+"""show end times and double-booking exclusion constraints
+
+Revision ID: a1c5e9d3f7b2
+Revises: f2b8c6d0a4e7
+Create Date: 2026-10-18 13:02:17.354190
+
+Existing shows are given the default two hour duration. The exclusion
+constraints cannot be created while double bookings exist; the upgrade
+stops with a list of the overlapping shows, which have to be moved or
+removed before running it again.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# Overlapping pairs listed per column when the upgrade is refused.
+REPORTED_OVERLAPS = 20
+
+# revision identifiers, used by Alembic.
+revision = 'a1c5e9d3f7b2'
+down_revision = 'f2b8c6d0a4e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "Show" SET end_time = start_time + interval \'2 hours\'')
+    op.alter_column('Show', 'end_time', nullable=False)
+    check_double_bookings()
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_booking" '
+               'EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)')
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_artist_booking" '
+               'EXCLUDE USING gist (artist_id WITH =, tsrange(start_time, end_time) WITH &&)')
+
+
+def check_double_bookings():
+    connection = op.get_bind()
+    problems = []
+    for column in ('venue_id', 'artist_id'):
+        rows = connection.execute(sa.text(
+            'SELECT a.{column}, a.id, b.id FROM "Show" a JOIN "Show" b '
+            'ON a.{column} = b.{column} AND a.id < b.id '
+            'AND tsrange(a.start_time, a.end_time) && tsrange(b.start_time, b.end_time) '
+            'ORDER BY a.{column}, a.id, b.id LIMIT :limit'.format(column=column)),
+            limit=REPORTED_OVERLAPS).fetchall()
+        problems += ['%s %s: shows %s and %s overlap' % (column, row[0], row[1], row[2])
+                     for row in rows]
+    if problems:
+        raise RuntimeError(
+            'Cannot add the double-booking constraints while shows overlap. '
+            'Move or delete these shows and upgrade again (at most %d pairs '
+            'per column are listed):\n  %s' % (REPORTED_OVERLAPS, '\n  '.join(problems)))
+
+
+def downgrade():
+    op.drop_constraint('ex_Show_artist_booking', 'Show')
+    op.drop_constraint('ex_Show_venue_booking', 'Show')
+    op.drop_column('Show', 'end_time')
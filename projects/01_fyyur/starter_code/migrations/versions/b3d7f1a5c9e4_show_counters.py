@@ -0,0 +1,34 @@
+"""upcoming and past show counters on Venue and Artist
+
+Revision ID: b3d7f1a5c9e4
+Revises: a1c5e9d3f7b2
+Create Date: 2026-10-18 13:47:52.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d7f1a5c9e4'
+down_revision = 'a1c5e9d3f7b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, show_key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{key} = "{table}".id AND start_time >= localtimestamp), '
+            'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{key} = "{table}".id AND start_time < localtimestamp)'
+            .format(table=table, key=show_key))
+
+
+def downgrade():
+    op.drop_column('Artist', 'past_shows_count')
+    op.drop_column('Artist', 'upcoming_shows_count')
+    op.drop_column('Venue', 'past_shows_count')
+    op.drop_column('Venue', 'upcoming_shows_count')
@@ -0,0 +1,35 @@
+"""trigram search indexes on Venue and Artist
+
+Revision ID: b7d41c9e2a63
+Revises: 5f79595d01fc
+Create Date: 2026-10-18 09:12:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41c9e2a63'
+down_revision = '5f79595d01fc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Venue_city_trgm', 'Venue', ['city'], unique=False, postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'})
+    op.create_index('ix_Venue_state_trgm', 'Venue', ['state'], unique=False, postgresql_using='gin', postgresql_ops={'state': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_city_trgm', 'Artist', ['city'], unique=False, postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_state_trgm', 'Artist', ['state'], unique=False, postgresql_using='gin', postgresql_ops={'state': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_Artist_state_trgm', table_name='Artist')
+    op.drop_index('ix_Artist_city_trgm', table_name='Artist')
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_state_trgm', table_name='Venue')
+    op.drop_index('ix_Venue_city_trgm', table_name='Venue')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
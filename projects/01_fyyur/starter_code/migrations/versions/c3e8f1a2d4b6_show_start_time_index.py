@@ -0,0 +1,24 @@
+"""index Show on (start_time, id) for keyset pagination
+
+Revision ID: c3e8f1a2d4b6
+Revises: b7d41c9e2a63
+Create Date: 2026-10-18 10:02:17.734590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8f1a2d4b6'
+down_revision = 'b7d41c9e2a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
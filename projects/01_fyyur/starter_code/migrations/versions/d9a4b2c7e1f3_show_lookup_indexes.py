@@ -0,0 +1,28 @@
+"""index Show foreign keys with start_time and Venue by area
+
+Revision ID: d9a4b2c7e1f3
+Revises: c3e8f1a2d4b6
+Create Date: 2026-10-18 10:47:55.120846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a4b2c7e1f3'
+down_revision = 'c3e8f1a2d4b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Venue_state_city_id', 'Venue', ['state', 'city', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city_id', table_name='Venue')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,28 @@
+"""track updated_at on Venue, Artist and Show
+
+Revision ID: e4f7a9c1b3d5
+Revises: d9a4b2c7e1f3
+Create Date: 2026-10-18 11:38:04.661275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f7a9c1b3d5'
+down_revision = 'd9a4b2c7e1f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('updated_at', sa.DateTime(), server_default=sa.text("(now() at time zone 'utc')"), nullable=False))
+    op.add_column('Artist', sa.Column('updated_at', sa.DateTime(), server_default=sa.text("(now() at time zone 'utc')"), nullable=False))
+    op.add_column('Show', sa.Column('updated_at', sa.DateTime(), server_default=sa.text("(now() at time zone 'utc')"), nullable=False))
+
+
+def downgrade():
+    op.drop_column('Show', 'updated_at')
+    op.drop_column('Artist', 'updated_at')
+    op.drop_column('Venue', 'updated_at')
@@ -0,0 +1,32 @@
+"""GIN index on Artist.genres and per-genre artist counts
+
+Revision ID: f2b8c6d0a4e7
+Revises: e4f7a9c1b3d5
+Create Date: 2026-10-18 12:21:39.087713
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8c6d0a4e7'
+down_revision = 'e4f7a9c1b3d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+    op.create_table('GenreCount',
+    sa.Column('genre', sa.String(length=120), nullable=False),
+    sa.Column('artist_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('genre')
+    )
+    op.execute('INSERT INTO "GenreCount" (genre, artist_count) '
+               'SELECT genre, count(*) FROM "Artist", unnest(genres) AS genre GROUP BY genre')
+
+
+def downgrade():
+    op.drop_table('GenreCount')
+    op.drop_index('ix_Artist_genres', table_name='Artist')
@@ -0,0 +1,154 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL profiling.
+#
+# Engine events time every statement run while a request is being handled.
+# Each response gets a Server-Timing header with the statement count and
+# database time (except streamed ones, whose queries run after the headers
+# are sent), totals are aggregated per endpoint for /_debug/queries, and
+# endpoints listed in QUERY_BUDGETS are checked against their statement
+# budget: a warning in production, an exception under TESTING, so a new N+1
+# pattern fails the test suite instead of reaching production.
+#----------------------------------------------------------------------------#
+
+import heapq
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOWEST_KEPT = 5
+PARAMETERS_MAX_LENGTH = 200
+
+
+class QueryBudgetExceeded(AssertionError):
+  pass
+
+
+class RequestProfile(object):
+  '''Statements run while handling one request.'''
+
+  def __init__(self):
+    self.count = 0
+    self.duration = 0.0
+    # (duration, sequence, statement, parameters), smallest first.
+    self.slowest = []
+
+  def add(self, statement, parameters, duration):
+    self.count += 1
+    self.duration += duration
+    entry = (duration, self.count, statement, _truncate(repr(parameters)))
+    if len(self.slowest) < SLOWEST_KEPT:
+      heapq.heappush(self.slowest, entry)
+    else:
+      heapq.heappushpop(self.slowest, entry)
+
+
+class QueryProfiler(object):
+
+  def __init__(self, app=None):
+    self.endpoints = {}
+    self._lock = threading.Lock()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    # Listening on the Engine class covers every engine and bind the app
+    # creates, whenever Flask-SQLAlchemy gets around to creating them.
+    event.listen(Engine, 'before_cursor_execute', self._before_execute)
+    event.listen(Engine, 'after_cursor_execute', self._after_execute)
+    app.before_request(self._start_request)
+    app.after_request(self._finish_request)
+
+  # The start time lives on the statement's execution context, so a
+  # statement that fails (and never reaches after_cursor_execute) leaves
+  # nothing behind on the pooled connection.
+  def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+      context._query_started = time.perf_counter()
+
+  def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is not None and has_request_context():
+      profile = g.get('query_profile')
+      if profile is not None:
+        duration = time.perf_counter() - started
+        profile.add(statement, parameters, duration)
+        slow_ms = self.app.config.get('SLOW_QUERY_MS')
+        if slow_ms is not None and duration * 1000 >= slow_ms:
+          self.app.logger.warning('slow query (%.1fms) in %s: %s', duration * 1000, request.endpoint,
+                                  statement, extra={'duration_ms': round(duration * 1000, 2),
+                                                    'parameters': _truncate(repr(parameters))})
+
+  def _start_request(self):
+    g.query_profile = RequestProfile()
+
+  def _finish_request(self, response):
+    profile = g.get('query_profile')
+    if profile is None:
+      return response
+
+    endpoint = request.endpoint or '<unmatched>'
+    if response.is_streamed:
+      # A streamed page runs its queries while the body is sent, after
+      # the headers: the profile stays in g until the response is closed,
+      # and there is no Server-Timing header.
+      response.call_on_close(lambda: self._finish_profile(endpoint, profile))
+      return response
+
+    g.pop('query_profile')
+    response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (
+      profile.duration * 1000, profile.count))
+    self._finish_profile(endpoint, profile)
+    return response
+
+  def _finish_profile(self, endpoint, profile):
+    self._aggregate(endpoint, profile)
+
+    budget = self.app.config.get('QUERY_BUDGETS', {}).get(endpoint)
+    if budget is not None and profile.count > budget:
+      message = '%s ran %d queries, its budget is %d:\n%s' % (
+        endpoint, profile.count, budget,
+        '\n'.join(statement for _, _, statement, _ in sorted(profile.slowest, reverse=True)))
+      if self.app.config.get('TESTING'):
+        raise QueryBudgetExceeded(message)
+      self.app.logger.warning(message)
+
+  def _aggregate(self, endpoint, profile):
+    with self._lock:
+      stats = self.endpoints.get(endpoint)
+      if stats is None:
+        stats = self.endpoints[endpoint] = {
+          'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0, 'slowest': []}
+      stats['requests'] += 1
+      stats['queries'] += profile.count
+      stats['max_queries'] = max(stats['max_queries'], profile.count)
+      stats['db_ms'] += profile.duration * 1000
+      stats['slowest'] = heapq.nlargest(SLOWEST_KEPT, stats['slowest'] + profile.slowest)
+
+  def report(self):
+    '''Per-endpoint totals and slowest statements, busiest endpoint first.'''
+    with self._lock:
+      endpoints = sorted(self.endpoints.items(), key=lambda item: -item[1]['db_ms'])
+      return [{
+        'endpoint': endpoint,
+        'requests': stats['requests'],
+        'queries_per_request': float(stats['queries']) / stats['requests'],
+        'max_queries': stats['max_queries'],
+        'db_ms_per_request': stats['db_ms'] / stats['requests'],
+        'budget': self.app.config.get('QUERY_BUDGETS', {}).get(endpoint),
+        'slowest': [{'ms': round(duration * 1000, 2), 'statement': statement, 'parameters': parameters}
+                    for duration, _, statement, parameters in stats['slowest']],
+      } for endpoint, stats in endpoints]
+
+  def reset(self):
+    with self._lock:
+      self.endpoints.clear()
+
+
+def _truncate(text):
+  if len(text) > PARAMETERS_MAX_LENGTH:
+    return text[:PARAMETERS_MAX_LENGTH] + '...'
+  return text
@@ -0,0 +1,61 @@
+#----------------------------------------------------------------------------#
+# Show scheduling.
+#
+# A show occupies its venue and its artist for [start_time, end_time). On
+# Postgres the a1c5e9d3f7b2 migration adds GiST exclusion constraints over
+# tsrange(start_time, end_time) per venue and per artist, so the database
+# itself rejects double bookings and the conflict lookups below are answered
+# from those indexes. On SQLite the same lookups fall back to the
+# (venue_id, start_time) / (artist_id, start_time) btree indexes.
+#----------------------------------------------------------------------------#
+
+from datetime import timedelta
+
+from sqlalchemy import and_, func, or_
+
+SHOW_DURATION = timedelta(hours=2)
+MAX_AVAILABILITY_WINDOW = timedelta(days=366)
+
+
+def overlaps(session, show, start, end):
+  '''SQL condition for show's time range overlapping [start, end).'''
+  if session.get_bind().dialect.name == 'postgresql':
+    return func.tsrange(show.start_time, show.end_time).op('&&')(func.tsrange(start, end))
+  return and_(show.start_time < end, show.end_time > start)
+
+
+def find_conflicts(session, show, start, end, venue_id=None, artist_id=None):
+  '''
+  Shows booked at venue_id or with artist_id that overlap [start, end),
+  earliest first.
+  '''
+  booked = []
+  if venue_id is not None:
+    booked.append(show.venue_id == venue_id)
+  if artist_id is not None:
+    booked.append(show.artist_id == artist_id)
+  if not booked:
+    return []
+
+  query = session.query(show)\
+              .filter(or_(*booked))\
+              .filter(overlaps(session, show, start, end))
+  return query.order_by(show.start_time, show.id).all()
+
+
+def free_intervals(busy, start, end):
+  '''
+  Gaps inside [start, end) not covered by the (start, end) pairs in busy,
+  which must be sorted by start.
+  '''
+  free = []
+  cursor = start
+  for busy_start, busy_end in busy:
+    if busy_start > cursor:
+      free.append((cursor, min(busy_start, end)))
+    cursor = max(cursor, busy_end)
+    if cursor >= end:
+      break
+  if cursor < end:
+    free.append((cursor, end))
+  return free
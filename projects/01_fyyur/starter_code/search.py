@@ -0,0 +1,113 @@
+#----------------------------------------------------------------------------#
+# Ranked search for venues and artists.
+#
+# On Postgres the name/city/state columns carry pg_trgm GIN indexes (see the
+# b7d41c9e2a63 migration), which serve the ILIKE filter directly; matches are
+# ranked by trigram similarity of the name. On SQLite, used for local testing,
+# an FTS5 table mirroring the same columns is kept in sync by triggers.
+#
+# Either way the page gets its rows and the total match count from a single
+# query, using count(*) OVER () instead of a second count() round trip.
+#----------------------------------------------------------------------------#
+
+import re
+import threading
+
+from sqlalchemy import func, or_, text
+
+SEARCH_RESULTS_LIMIT = 50
+SEARCH_COLUMNS = ('name', 'city', 'state')
+
+_fts_tables = set()
+_fts_lock = threading.Lock()
+
+
+def ranked_search(session, model, term, limit=SEARCH_RESULTS_LIMIT):
+  '''
+  Search model's name, city and state for term.
+
+  Returns (total, rows) where rows are the best `limit` matches, each with
+  `id` and `name`, and total counts every match.
+  '''
+  term = (term or '').strip()
+  bind = session.get_bind()
+  if bind.dialect.name == 'sqlite':
+    rows = _fts5_search(session, bind, model, term, limit)
+  else:
+    rows = _trigram_search(session, model, term, limit)
+  total = rows[0].total if rows else 0
+  return total, rows
+
+
+def _escape_like(term):
+  return term.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+def _trigram_search(session, model, term, limit):
+  pattern = '%' + _escape_like(term) + '%'
+  columns = [getattr(model, column) for column in SEARCH_COLUMNS]
+
+  return session.query(model.id, model.name, func.count().over().label('total'))\
+              .filter(or_(*[column.ilike(pattern, escape='!') for column in columns]))\
+              .order_by(func.similarity(model.name, term).desc(), model.name, model.id)\
+              .limit(limit)\
+              .all()
+
+
+def _fts5_search(session, bind, model, term, limit):
+  table = model.__tablename__
+  tokens = re.findall(r'\w+', term)
+  if not tokens:
+    return session.query(model.id, model.name, func.count().over().label('total'))\
+                .order_by(model.name, model.id)\
+                .limit(limit)\
+                .all()
+
+  _ensure_fts5_table(bind, table)
+  # Every token must match as a prefix of some word; the name is weighted
+  # above city and state when ranking.
+  match = ' '.join('"%s"*' % token for token in tokens)
+  statement = text(
+    'SELECT id, name, count(*) OVER () AS total FROM ('
+    'SELECT rowid AS id, name, bm25("{fts}", 10.0, 1.0, 1.0) AS score '
+    'FROM "{fts}" WHERE "{fts}" MATCH :match) '
+    'ORDER BY score, name, id '
+    'LIMIT :limit'.format(fts=table + '_search'))
+  return session.execute(statement, {'match': match, 'limit': limit}).fetchall()
+
+
+def _ensure_fts5_table(bind, table):
+  key = (id(bind), table)
+  if key in _fts_tables:
+    return
+
+  with _fts_lock:
+    if key in _fts_tables:
+      return
+    fts = table + '_search'
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join('new.' + column for column in SEARCH_COLUMNS)
+    old_values = ', '.join('old.' + column for column in SEARCH_COLUMNS)
+    with bind.begin() as connection:
+      exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': fts}).scalar()
+      if not exists:
+        connection.execute(
+          'CREATE VIRTUAL TABLE "{fts}" USING fts5({columns}, '
+          'content=\'{table}\', content_rowid=\'id\')'.format(fts=fts, table=table, columns=columns))
+        connection.execute(
+          'CREATE TRIGGER "{fts}_ai" AFTER INSERT ON "{table}" BEGIN '
+          'INSERT INTO "{fts}"(rowid, {columns}) VALUES (new.id, {new}); END'
+          .format(fts=fts, table=table, columns=columns, new=new_values))
+        connection.execute(
+          'CREATE TRIGGER "{fts}_ad" AFTER DELETE ON "{table}" BEGIN '
+          'INSERT INTO "{fts}"("{fts}", rowid, {columns}) VALUES (\'delete\', old.id, {old}); END'
+          .format(fts=fts, table=table, columns=columns, old=old_values))
+        connection.execute(
+          'CREATE TRIGGER "{fts}_au" AFTER UPDATE ON "{table}" BEGIN '
+          'INSERT INTO "{fts}"("{fts}", rowid, {columns}) VALUES (\'delete\', old.id, {old}); '
+          'INSERT INTO "{fts}"(rowid, {columns}) VALUES (new.id, {new}); END'
+          .format(fts=fts, table=table, columns=columns, old=old_values, new=new_values))
+        connection.execute('INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')'.format(fts=fts))
+    _fts_tables.add(key)
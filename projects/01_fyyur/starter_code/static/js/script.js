@@ -2,3 +2,33 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Suggest venue or artist names from /autocomplete while typing in the
+// navbar search boxes.
+document.querySelectorAll('input[data-autocomplete]').forEach(function (input) {
+  var kind = input.dataset.autocomplete;
+  var list = document.getElementById(input.getAttribute('list'));
+  var pending = null;
+  input.addEventListener('input', function () {
+    var q = input.value.trim();
+    if (pending) {
+      pending.abort();
+    }
+    if (!q) {
+      list.innerHTML = '';
+      return;
+    }
+    pending = new AbortController();
+    fetch('/autocomplete?limit=8&q=' + encodeURIComponent(q), { signal: pending.signal })
+      .then(function (response) { return response.json(); })
+      .then(function (results) {
+        list.innerHTML = '';
+        results[kind].forEach(function (item) {
+          var option = document.createElement('option');
+          option.value = item.name;
+          list.appendChild(option);
+        });
+      })
+      .catch(function () {});
+  });
+});
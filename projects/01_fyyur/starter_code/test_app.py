@@ -0,0 +1,115 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import app, db, page_cache, Venue, VenueForm
+from importer import import_rows, read_rows
+
+
+class AppTestCase(unittest.TestCase):
+    """Request handling and imports against a throwaway SQLite database."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.saved_config = dict(app.config)
+        app.config.update(
+            TESTING=True,
+            WTF_CSRF_ENABLED=False,
+            SECRET_KEY='test',
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(cls.directory, 'fyyur.db'),
+            SQLALCHEMY_BINDS={},
+        )
+        cls.page_cache_enabled = page_cache.enabled
+        page_cache.enabled = True
+
+        with app.app_context():
+            db.create_all()
+            db.session.add(Venue(name='Hall', city='City', state='NY', seeking_talent=False))
+            db.session.commit()
+            cls.venue_id = Venue.query.filter_by(name='Hall').one().id
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.get_engine().dispose()
+        app.config.clear()
+        app.config.update(cls.saved_config)
+        page_cache.enabled = cls.page_cache_enabled
+        page_cache.clear()
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.client = app.test_client()
+        page_cache.clear()
+
+    def cursor(self, payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+    def test_shows_cursor(self):
+        res = self.client.get('/shows?cursor=' + self.cursor(['2030-01-01T20:00:00', 1]))
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_mistyped_shows_cursor(self):
+        for payload in ([1, 1], ['2030-01-01T20:00:00', '1'], ['2030-01-01T20:00:00', True],
+                        ['not a date', 1], ['2030-01-01T20:00:00'], {'id': 1}):
+            res = self.client.get('/shows?cursor=' + self.cursor(payload))
+            self.assertEqual(res.status_code, 400, payload)
+
+        res = self.client.get('/shows?cursor=not-base64!')
+        self.assertEqual(res.status_code, 400)
+
+    def test_changed_version_misses_page_cache(self):
+        url = '/venues/%d' % self.venue_id
+        res = self.client.get(url)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        etag = res.headers['ETag']
+        res = self.client.get(url)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+
+        # A write that didn't invalidate the page cache, e.g. from another
+        # process.
+        with app.app_context():
+            db.session.execute('UPDATE "Venue" SET name = :name, updated_at = :updated_at '
+                               'WHERE id = :id', {'name': 'Renamed Hall', 'id': self.venue_id,
+                                                  'updated_at': '2030-01-01 00:00:00.000000'})
+            db.session.commit()
+
+        res = self.client.get(url)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertIn(b'Renamed Hall', res.data)
+
+    def test_import_rejects_unreadable_lines(self):
+        rows = io.StringIO('\n'.join([
+            json.dumps({'name': 'Imported Hall', 'city': 'City', 'state': 'NY',
+                        'address': '1 Street', 'phone': '123',
+                        'facebook_link': 'http://facebook.com/hall',
+                        'website': 'http://example.com'}),
+            '{"name": "Broken Hall",',
+            '["not", "an", "object"]',
+        ]))
+        rejects = []
+
+        with app.app_context():
+            imported, rejected = import_rows(db.session, Venue.__table__, VenueForm,
+                                             read_rows(rows, 'jsonl'),
+                                             on_reject=lambda line_num, errors: rejects.append((line_num, errors)))
+            names = [venue.name for venue in Venue.query]
+
+        self.assertEqual((imported, rejected), (1, 2))
+        self.assertIn('Imported Hall', names)
+        self.assertEqual([line_num for line_num, _ in rejects], [2, 3])
+        self.assertTrue(rejects[0][1]['line'][0].startswith('Not valid JSON'))
+        self.assertEqual(rejects[1][1], {'line': ['Not a JSON object.']})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
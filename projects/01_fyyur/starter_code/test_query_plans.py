@@ -0,0 +1,182 @@
+import os
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import event
+
+from app import app, db, Venue, Artist, Show, encode_cursor, invalidate_venue_areas
+from scheduling import SHOW_DURATION
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+VENUES = 500
+ARTISTS = 500
+SHOWS = 5000
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Fails when a controller query can only be answered by a sequential scan.
+
+    Every SELECT a route issues is captured and re-run under EXPLAIN with
+    enable_seqscan off, so the planner only picks a Seq Scan on a table
+    when no index can serve the query at all.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.database_name = "fyyur_test"
+        cls.database_path = "postgres://{}/{}".format(
+            'postgres:postgres@localhost:5432', cls.database_name)
+        app.config['SQLALCHEMY_DATABASE_URI'] = cls.database_path
+        app.config['TESTING'] = True
+
+        with app.app_context():
+            downgrade(directory=MIGRATIONS, revision='base')
+            upgrade(directory=MIGRATIONS)
+            cls.seed()
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            downgrade(directory=MIGRATIONS, revision='base')
+
+    @classmethod
+    def seed(cls):
+        rng = random.Random(42)
+        now = datetime.now()
+        db.session.execute(Venue.__table__.insert(), [{
+            'name': 'Venue %d' % i,
+            'city': 'City %d' % (i % 50),
+            'state': 'NY',
+            'seeking_talent': False,
+        } for i in range(VENUES)])
+        db.session.execute(Artist.__table__.insert(), [{
+            'name': 'Artist %d' % i,
+            'city': 'City %d' % (i % 50),
+            'state': 'CA',
+            'genres': ['Jazz'],
+            'seeking_venue': False,
+        } for i in range(ARTISTS)])
+        db.session.commit()
+
+        venue_ids = [row.id for row in Venue.query.with_entities(Venue.id)]
+        artist_ids = [row.id for row in Artist.query.with_entities(Artist.id)]
+        # Every show gets its own two hour slot within a year either side
+        # of now, so none of them trips the double-booking constraints.
+        slots = rng.sample(range(-24 * 365 // 2, 24 * 365 // 2), SHOWS)
+        db.session.execute(Show.__table__.insert(), [{
+            'venue_id': rng.choice(venue_ids),
+            'artist_id': rng.choice(artist_ids),
+            'start_time': now + timedelta(hours=2 * slot),
+            'end_time': now + timedelta(hours=2 * slot) + SHOW_DURATION,
+        } for slot in slots])
+        db.session.commit()
+        db.session.execute('ANALYZE')
+        db.session.commit()
+
+        cls.venue_id = venue_ids[0]
+        cls.artist_id = artist_ids[0]
+
+    def setUp(self):
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        invalidate_venue_areas()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def capture_selects(self, method, url, **kwargs):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            res = self.client().open(url, method=method, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(statements)
+        return statements
+
+    def explain(self, statement, parameters):
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+            plan = cursor.fetchone()[0][0]['Plan']
+            connection.rollback()
+        finally:
+            connection.close()
+        return plan
+
+    def seq_scans(self, plan):
+        scans = set()
+        if plan['Node Type'] == 'Seq Scan':
+            scans.add(plan['Relation Name'])
+        for child in plan.get('Plans', []):
+            scans |= self.seq_scans(child)
+        return scans
+
+    def assertNoSeqScan(self, method, url, allowed=(), **kwargs):
+        for statement, parameters in self.capture_selects(method, url, **kwargs):
+            plan = self.explain(statement, parameters)
+            scans = self.seq_scans(plan) - set(allowed)
+            self.assertFalse(scans, 'Seq Scan on %s for %s %s:\n%s' % (
+                ', '.join(sorted(scans)), method, url, statement))
+
+    # listings
+
+    def test_venues_plan(self):
+        self.assertNoSeqScan('GET', '/venues')
+
+    def test_artists_plan(self):
+        # The artist listing returns every row by design.
+        self.assertNoSeqScan('GET', '/artists', allowed=['Artist', 'GenreCount'])
+
+    def test_artists_by_genre_plan(self):
+        # The genre facet table holds one row per genre.
+        self.assertNoSeqScan('GET', '/artists', allowed=['GenreCount'],
+                             query_string={'genre': 'Jazz'})
+
+    def test_shows_plan(self):
+        self.assertNoSeqScan('GET', '/shows')
+
+    def test_shows_next_page_plan(self):
+        cursor = encode_cursor([datetime.now(), 0])
+        self.assertNoSeqScan('GET', '/shows', query_string={'cursor': cursor})
+
+    # detail pages
+
+    def test_show_venue_plan(self):
+        self.assertNoSeqScan('GET', '/venues/%d' % self.venue_id)
+
+    def test_show_artist_plan(self):
+        self.assertNoSeqScan('GET', '/artists/%d' % self.artist_id)
+
+    def test_venue_availability_plan(self):
+        self.assertNoSeqScan('GET', '/venues/%d/availability' % self.venue_id)
+
+    # search
+
+    def test_search_venues_plan(self):
+        self.assertNoSeqScan('POST', '/venues/search',
+                             data={'search_term': 'Venue 12'})
+
+    def test_search_artists_plan(self):
+        self.assertNoSeqScan('POST', '/artists/search',
+                             data={'search_term': 'Artist 12'})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from app import app, db, page_cache, Artist
+from search import _ensure_fts5_table
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    """Read-only routes use the replica bind; writers stick to the primary.
+
+    Two SQLite files stand in for the primary and the replica. They are
+    never synchronised, so which one served a page shows in its content.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.saved_config = dict(app.config)
+        app.config.update(
+            TESTING=True,
+            WTF_CSRF_ENABLED=False,
+            SECRET_KEY='test',
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(cls.directory, 'primary.db'),
+            SQLALCHEMY_BINDS={'replica': 'sqlite:///' + os.path.join(cls.directory, 'replica.db')},
+        )
+        cls.page_cache_enabled = page_cache.enabled
+        page_cache.enabled = False
+
+        with app.app_context():
+            for name, engine in (('Primary', db.engine), ('Replica', db.get_engine(bind='replica'))):
+                db.Model.metadata.create_all(engine)
+                engine.execute(Artist.__table__.insert(), {
+                    'name': '%s Artist' % name, 'city': 'City', 'state': 'NY',
+                    'genres': ['Jazz'], 'seeking_venue': False,
+                })
+                # Build the search table now rather than inside a request,
+                # where its DDL would count against the query budget.
+                _ensure_fts5_table(engine, 'Artist')
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.get_engine().dispose()
+            db.get_engine(bind='replica').dispose()
+        app.config.clear()
+        app.config.update(cls.saved_config)
+        page_cache.enabled = cls.page_cache_enabled
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def create_artist(self, name):
+        return self.client.post('/artists/create', data={
+            'name': name, 'city': 'City', 'state': 'NY', 'phone': '123',
+            'genres': ['Jazz'], 'facebook_link': 'http://facebook.com/x',
+            'image_link': '', 'website': 'http://example.com', 'seeking_description': '',
+        })
+
+    def test_listing_reads_replica(self):
+        res = self.client.get('/artists')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Replica Artist', res.data)
+        self.assertNotIn(b'Primary Artist', res.data)
+
+    def test_search_reads_replica_without_sticking(self):
+        res = self.client.post('/artists/search', data={'search_term': 'Artist'})
+        self.assertIn(b'Replica Artist', res.data)
+
+        res = self.client.get('/artists')
+        self.assertIn(b'Replica Artist', res.data)
+
+    def test_writer_reads_primary_until_sticky_window_ends(self):
+        res = self.create_artist('Fresh Artist')
+        self.assertIn(b'successfully listed', res.data)
+
+        res = self.client.get('/artists')
+        self.assertIn(b'Fresh Artist', res.data)
+        self.assertIn(b'Primary Artist', res.data)
+
+        other = app.test_client().get('/artists')
+        self.assertNotIn(b'Fresh Artist', other.data)
+
+        with mock.patch('app.time.time', return_value=2 ** 40):
+            res = self.client.get('/artists')
+        self.assertNotIn(b'Fresh Artist', res.data)
+
+    def test_cached_replica_page_is_not_served_to_writer(self):
+        page_cache.enabled = True
+        self.addCleanup(setattr, page_cache, 'enabled', False)
+        self.addCleanup(page_cache.clear)
+
+        res = self.create_artist('Cached Artist')
+        self.assertIn(b'successfully listed', res.data)
+
+        # Another user refills the cache from the replica, which hasn't
+        # caught up with the write.
+        other = app.test_client()
+        res = other.get('/artists')
+        self.assertNotIn(b'Cached Artist', res.data)
+        res = other.get('/artists')
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+
+        res = self.client.get('/artists')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn(b'Cached Artist', res.data)
+
+        # The writer's page replaced the replica's, and is kept for the
+        # full TTL.
+        with mock.patch('cache.time.monotonic', return_value=time.monotonic() + 60):
+            res = other.get('/artists')
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        self.assertIn(b'Cached Artist', res.data)
+
+    def test_replica_page_is_cached_for_sticky_window(self):
+        page_cache.enabled = True
+        self.addCleanup(setattr, page_cache, 'enabled', False)
+        self.addCleanup(page_cache.clear)
+
+        res = self.client.get('/artists')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+
+        later = time.monotonic() + app.config['REPLICA_STICKY_SECONDS'] + 1
+        with mock.patch('cache.time.monotonic', return_value=later):
+            res = self.client.get('/artists')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+
+    def test_without_replica_bind_reads_primary(self):
+        with mock.patch.dict(app.config, SQLALCHEMY_BINDS={}):
+            res = self.client.get('/artists')
+
+        self.assertIn(b'Primary Artist', res.data)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+'''
+Benchmark for POST /quizzes round latency.
+
+Fills a database with --questions questions over --categories categories
+and plays --quizzes quizzes of --rounds rounds each in one category,
+posting the previous questions every round as the frontend does. Reports
+the median latency of the first, middle and last rounds, for the
+endpoint and for the previous implementation, which loaded every unseen
+question in the category and picked one in Python (run for
+--baseline-rounds rounds only, as it takes seconds per round at 1M).
+
+    python benchmarks/bench_quiz.py [--questions 1000000] [--database-path URL]
+
+Uses an in-memory SQLite database by default.
+'''
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import create_app
+from models import db, Question
+
+
+def seed(questions, categories):
+    db.create_all()
+    if Question.query.count():
+        return
+    batch = 50000
+    for start in range(0, questions, batch):
+        db.session.execute(Question.__table__.insert(), [{
+            'question': 'Question %d' % i, 'answer': 'Answer %d' % i,
+            'category': str(i % categories + 1), 'difficulty': i % 5 + 1,
+        } for i in range(start, min(start + batch, questions))])
+        db.session.commit()
+
+
+def previous_implementation(category, previous_questions):
+    questions = Question.query.filter(Question.category == category)\
+        .filter(Question.id.notin_(previous_questions)).all()
+    return random.choice([question.format() for question in questions])
+
+
+def play(rounds, ask):
+    previous, timings = [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        question = ask(previous)
+        timings.append((time.perf_counter() - start) * 1000)
+        previous.append(question['id'])
+    return timings
+
+
+def report(name, quizzes):
+    rounds = len(quizzes[0])
+    picks = sorted(set([0, rounds // 2, rounds - 1]))
+    print('%-10s' % name + ''.join(
+        '  round %-4d %8.2fms' % (i + 1, statistics.median(quiz[i] for quiz in quizzes))
+        for i in picks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--quizzes', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--baseline-rounds', type=int, default=3)
+    parser.add_argument('--database-path', default='sqlite://')
+    args = parser.parse_args()
+
+    app = create_app({'DATABASE_PATH': args.database_path})
+    client = app.test_client()
+    category = {'id': 1, 'type': 'Category 1'}
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed(args.questions, args.categories)
+        print('seeded %d questions in %.1fs' % (args.questions, time.perf_counter() - start))
+
+        def ask(previous):
+            response = client.post('/quizzes', json={
+                'previous_questions': previous, 'quiz_category': category})
+            return response.get_json()['question']
+
+        start = time.perf_counter()
+        ask([])
+        print('deck loaded by the first round in %.1fs' % (time.perf_counter() - start))
+
+        report('deck', [play(args.rounds, ask) for _ in range(args.quizzes)])
+        report('previous', [play(args.baseline_rounds, lambda previous:
+                                 previous_implementation(category['id'], previous))])
+
+
+if __name__ == '__main__':
+    main()
@@ -2,21 +2,105 @@ import os
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 from werkzeug.exceptions import BadRequest, InternalServerError, NotFound, UnprocessableEntity
 
-from models import setup_db, Question, Category
+from models import db, setup_db, database_path, Question
+from .categories import CategoryCache
+from .pagination import TOTAL_MODES, count_total, decode_cursor, \
+    encode_cursor, keyset_page
+from .quiz import QuestionDeck
+from .quiz_store import MemoryQuizStore, RedisQuizStore, new_session_id
+from .search import highlight_html, search_questions
 
 QUESTIONS_PER_PAGE = 10
+MAX_QUESTIONS_PER_PAGE = 100
+# How /questions and /questions/search count the total by default: 'exact',
+# 'estimate' (the planner's estimate on Postgres) or 'none'.
+QUESTIONS_TOTAL = 'exact'
+# Seconds before the quiz deck is reloaded to pick up questions added or
+# deleted by other processes.
+QUESTION_DECK_MAX_AGE = 300
+# Seconds before cached categories are reloaded, for the same reason.
+CATEGORY_CACHE_MAX_AGE = 300
+# Seconds a quiz session is kept after its last round.
+QUIZ_SESSION_TTL = 3600
+
+
+def create_quiz_store(config):
+    ttl = config.get('QUIZ_SESSION_TTL', QUIZ_SESSION_TTL)
+    redis_url = config.get('QUIZ_SESSION_REDIS_URL',
+                           os.environ.get('QUIZ_SESSION_REDIS_URL'))
+    if redis_url:
+        import redis
+        return RedisQuizStore(redis.Redis.from_url(redis_url), ttl)
+    return MemoryQuizStore(ttl)
+
+
+def quiz_category_id(body):
+    quiz_category = body.get('quiz_category', '')
+    if not quiz_category:
+        return 0
+    try:
+        return int(quiz_category.get('id', 0))
+    except (AttributeError, TypeError, ValueError):
+        raise BadRequest
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config:
+        app.config.update(test_config)
+    setup_db(app, app.config.get('DATABASE_PATH', database_path))
 
     CORS(app)
 
+    question_deck = QuestionDeck(max_age=app.config.get(
+        'QUESTION_DECK_MAX_AGE', QUESTION_DECK_MAX_AGE))
+    quiz_store = create_quiz_store(app.config)
+    category_cache = CategoryCache(max_age=app.config.get(
+        'CATEGORY_CACHE_MAX_AGE', CATEGORY_CACHE_MAX_AGE))
+
+    def draw_question(category_id, seen):
+        '''A random question in the category not in seen, or None.'''
+        question_deck.ensure_loaded()
+        while True:
+            question_id = question_deck.draw(category_id, seen)
+            if question_id is None:
+                return None
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+            # Deleted by another process since the deck was loaded.
+            question_deck.discard(question_id)
+
+    def per_page_arg():
+        per_page = request.args.get('per_page', app.config.get(
+            'QUESTIONS_PER_PAGE', QUESTIONS_PER_PAGE), type=int)
+        return min(max(per_page, 1), MAX_QUESTIONS_PER_PAGE)
+
+    def question_page(query):
+        '''
+        A page of questions from query, by ?cursor= (keyset) or, for
+        numbered pages, ?page=; ?per_page= sets the size and ?total= how
+        the total is counted.
+        '''
+        per_page = per_page_arg()
+        total = request.args.get('total', app.config.get(
+            'QUESTIONS_TOTAL', QUESTIONS_TOTAL))
+        if total not in TOTAL_MODES:
+            raise BadRequest
+
+        questions, next_cursor = keyset_page(
+            query, Question.id, per_page,
+            cursor=request.args.get('cursor'),
+            page=request.args.get('page', type=int))
+        return {
+            'questions': [question.format() for question in questions],
+            'total_questions': count_total(db.session, query, total),
+            'next_cursor': next_cursor
+        }
+
     @app.after_request
     def access_control_allow(response):
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -25,28 +109,29 @@ def create_app(test_config=None):
     @app.route('/categories', methods=['GET'])
     def get_categories():
         try:
-            categories = {
-                'categories': list(map(lambda x: x.type, Category.query.all()))
-            }
-            return jsonify(categories)
+            version, categories = category_cache.get()
         except Exception:
             raise InternalServerError
+        response = jsonify({
+            'categories': [type for _, type in categories],
+            'categories_version': version
+        })
+        response.set_etag(version)
+        return response.make_conditional(request)
 
     @app.route('/questions', methods=['GET'])
     def get_questions():
-        page = request.args.get('page', 1, type=int)
-        question_query = Question.query.paginate(
-            page, QUESTIONS_PER_PAGE, False)
-        question_items = [question.format()
-                          for question in question_query.items]
-        total_questions = question_query.total
-        categories = [category.type for category in Category.query.all()]
-        return jsonify({
-            'questions': question_items,
-            'total_questions': total_questions,
-            'categories': categories,
+        response = question_page(Question.query)
+        version, categories = category_cache.get()
+        response.update({
+            'categories_version': version,
             'current_category': ''
         })
+        # Clients holding this version of the categories already can
+        # pass it back to leave them out.
+        if request.args.get('categories_version') != version:
+            response['categories'] = [type for _, type in categories]
+        return jsonify(response)
 
     @app.route('/questions/<int:id>', methods=['DELETE'])
     def delete_question(id):
@@ -56,6 +141,7 @@ def create_app(test_config=None):
             if not question:
                 raise NotFound
             question.delete()
+            question_deck.discard(id)
         except Exception:
             raise InternalServerError
         return jsonify({
@@ -77,6 +163,7 @@ def create_app(test_config=None):
         try:
             question = Question(question, answer, category, difficulty)
             question.insert()
+            question_deck.add(question.id, question.category)
         except Exception:
             raise InternalServerError
 
@@ -89,28 +176,37 @@ def create_app(test_config=None):
         body = request.get_json()
         search_term = body.get('searchTerm', '')
 
-        page = request.args.get('page', 1, type=int)
-
-        query = '%' + search_term + '%'
-
-        questions_page = Question.query.filter(Question.question.ilike(
-            query)).paginate(page, QUESTIONS_PER_PAGE, False)
+        per_page = per_page_arg()
+        cursor = request.args.get('cursor')
+        if cursor:
+            offset = decode_cursor(cursor, 'offset')
+        else:
+            offset = (max(request.args.get('page', 1, type=int), 1) - 1) \
+                * per_page
 
-        questions = questions_page.items
-        questions_formatted = [question.format() for question in questions]
+        total, rows = search_questions(db.session, search_term,
+                                       per_page, offset)
+        next_offset = offset + per_page
 
         return jsonify({
-            'questions': questions_formatted,
-            'total_questions': questions_page.total,
+            'questions': [dict(Question.format(row), highlight={
+                'question': highlight_html(row.question_highlight),
+                'answer': highlight_html(row.answer_highlight)
+            }) for row in rows],
+            'total_questions': total,
+            'next_cursor': encode_cursor(offset=next_offset)
+            if next_offset < total else None,
             'current_category': ''
         })
 
     @app.route('/categories/<id>/questions', methods=['GET'])
     def get_questions_by_category(id):
 
-        category = Category.query.get(id)
+        _, categories = category_cache.get()
+        category_type = dict((str(category_id), type)
+                             for category_id, type in categories).get(id)
 
-        if not category:
+        if category_type is None:
             raise NotFound
 
         question_by_category = Question.query.filter(
@@ -120,7 +216,7 @@ def create_app(test_config=None):
 
         total_questions = len(question_by_category_formatted)
 
-        category_formatted = category.format() if category else ''
+        category_formatted = {'id': int(id), 'type': category_type}
 
         return jsonify({
             "questions": question_by_category_formatted,
@@ -132,26 +228,46 @@ def create_app(test_config=None):
     def get_questions_for_quiz():
         body = request.get_json()
         previous_questions = body.get('previous_questions', '')
-        quiz_category = body.get('quiz_category', '')
 
-        if not quiz_category:
-            quiz_category_id = 0
-        else:
-            quiz_category_id = int(quiz_category.get('id', 0))
+        question = draw_question(quiz_category_id(body),
+                                 set(previous_questions or []))
+
+        return jsonify({
+            "question": question.format() if question else None
+        })
 
-        question_filter_query = Question.query.filter(
-            Question.category == quiz_category_id)
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        body = request.get_json(silent=True) or {}
 
-        if quiz_category_id == 0:
-            question_filter_query = Question.query
+        session_id = new_session_id()
+        quiz_store.create(session_id, quiz_category_id(body))
 
-        questions = question_filter_query.filter(
-            Question.id.notin_(previous_questions)).all()
+        return jsonify({
+            "status": 'Success',
+            "session_id": session_id,
+            "expires_in": quiz_store.ttl
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        while True:
+            state = quiz_store.get(session_id)
+            if state is None:
+                raise NotFound
 
-        questions_formatted = [question.format() for question in questions]
+            question = draw_question(state['category'], state['seen'])
+            if question is None:
+                round_number = state['round']
+                break
+            round_number = quiz_store.claim(session_id, question.id)
+            if round_number is not None:
+                break
+            # A concurrent round served the same question; draw again.
 
         return jsonify({
-            "question": random.choice(questions_formatted)
+            "question": question.format() if question else None,
+            "round": round_number
         })
 
     @app.errorhandler(BadRequest)
@@ -0,0 +1,74 @@
+'''
+In-process cache of the category table.
+
+Categories are loaded once and kept until a commit that inserts, updates
+or deletes one (Category.insert() among them), or until they are max_age
+seconds old, which picks up changes committed by other processes. The
+cached table has a version, a hash of its content, which is the same in
+every process holding the same categories: /categories sends it as the
+ETag and /questions leaves the categories out when the client already has
+that version.
+'''
+import json
+import threading
+import time
+import weakref
+from hashlib import sha1
+
+from sqlalchemy import event
+
+from models import db, Category
+
+# Every live cache, for the session listeners below. They are registered
+# once, not per cache, so creating an app doesn't add another pair.
+_caches = weakref.WeakSet()
+
+
+class CategoryCache(object):
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._table = None
+        self._loaded = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self):
+        '''(version, categories) with categories as a list of (id, type).'''
+        table = self._table
+        if table is not None and (self.max_age is None or
+                                  time.monotonic() - self._loaded <= self.max_age):
+            return table
+
+        generation = self._generation
+        categories = [(row.id, row.type) for row in
+                      db.session.query(Category.id, Category.type)
+                      .order_by(Category.id)]
+        version = sha1(json.dumps(categories).encode('utf-8')).hexdigest()[:16]
+        table = (version, categories)
+        with self._lock:
+            # Don't publish a table read before a concurrent invalidation.
+            if generation == self._generation:
+                self._table = table
+                self._loaded = time.monotonic()
+        return table
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._table = None
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_changes(session, flush_context):
+    if any(isinstance(instance, Category) for instance in
+           list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info['categories_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_if_changed(session):
+    if session.info.pop('categories_changed', False):
+        for cache in list(_caches):
+            cache.invalidate()
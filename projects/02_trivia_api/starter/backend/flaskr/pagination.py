@@ -0,0 +1,71 @@
+'''
+Keyset pagination for question listings.
+
+A page is the rows after the last id of the previous page, ordered by id,
+so every page is an index range scan however deep it is. The position is
+handed to the client as an opaque cursor. Totals are optional: exact
+(COUNT(*)), estimated from the Postgres planner's row estimate, which
+costs no scan, or left out. Ranked search results have no such key and
+are paged by position instead, with the offset in the cursor.
+'''
+import base64
+import json
+
+from werkzeug.exceptions import BadRequest
+
+TOTAL_MODES = ('exact', 'estimate', 'none')
+
+
+def encode_cursor(**position):
+    payload = json.dumps(position).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, name):
+    '''The integer position called name in cursor.'''
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded))[name]
+    except (ValueError, TypeError, KeyError):
+        raise BadRequest
+    if not isinstance(value, int) or value < 0:
+        raise BadRequest
+    return value
+
+
+def keyset_page(query, key, per_page, cursor=None, page=None):
+    '''
+    (rows, next_cursor) for the page after cursor, or for the numbered
+    page (with an OFFSET) when page is given instead.
+    '''
+    query = query.order_by(key)
+    if cursor:
+        query = query.filter(key > decode_cursor(cursor, 'after'))
+    elif page is not None:
+        query = query.offset((max(page, 1) - 1) * per_page)
+    rows = query.limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, encode_cursor(after=getattr(rows[-1], key.key))
+
+
+def estimate_count(session, query):
+    '''The planner's row estimate for query on Postgres, else an exact count.'''
+    bind = session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return query.order_by(None).count()
+    statement = query.order_by(None).statement.compile(dialect=bind.dialect)
+    plan = session.connection().execute(
+        'EXPLAIN (FORMAT JSON) %s' % statement, statement.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_total(session, query, mode):
+    if mode == 'none':
+        return None
+    if mode == 'estimate':
+        return estimate_count(session, query)
+    return query.order_by(None).count()
@@ -0,0 +1,111 @@
+'''
+Random question selection for quizzes.
+
+QuestionDeck keeps the question ids of every category, and of all
+categories together, in arrays shuffled when they are loaded. A round picks
+random positions until it lands on an id the player has not seen, which
+takes O(1) tries while most of the category is unseen, so only the chosen
+question is ever loaded from the database.
+'''
+import random
+import threading
+import time
+from array import array
+
+from models import db, Question
+
+ALL_CATEGORIES = 0
+# Random picks before falling back to scanning for the unseen ids.
+MAX_PICKS = 32
+
+
+def category_key(category):
+    return str(category or ALL_CATEGORIES)
+
+
+class QuestionDeck(object):
+
+    def __init__(self, max_age=None, rng=None):
+        # Reload from the database once the deck is older than max_age
+        # seconds, to pick up questions written by other processes.
+        self.max_age = max_age
+        self.rng = rng or random.Random()
+        self._decks = None
+        self._deleted = set()
+        self._loaded = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def is_stale(self):
+        if self._loaded is None:
+            return True
+        return self.max_age is not None and \
+            time.monotonic() - self._loaded > self.max_age
+
+    def load(self, rows):
+        '''Replace the deck with rows of (question id, category).'''
+        every = array('q')
+        by_category = {}
+        for question_id, category in rows:
+            every.append(question_id)
+            ids = by_category.get(category)
+            if ids is None:
+                ids = by_category[category] = array('q')
+            ids.append(question_id)
+
+        decks = dict((category_key(category), ids)
+                     for category, ids in by_category.items())
+        decks[category_key(ALL_CATEGORIES)] = every
+        for ids in decks.values():
+            self.rng.shuffle(ids)
+        with self._lock:
+            self._decks = decks
+            self._deleted = set()
+            self._loaded = time.monotonic()
+
+    def ensure_loaded(self):
+        if not self.is_stale():
+            return self
+
+        # One request reloads; the others wait for it and reuse its deck.
+        with self._reload_lock:
+            if self.is_stale():
+                self.load(db.session.execute(
+                    db.select([Question.id, Question.category])))
+        return self
+
+    def add(self, question_id, category):
+        '''Shuffle a new question into its category and the whole deck.'''
+        if self._decks is None:
+            return
+        with self._lock:
+            for key in (category_key(ALL_CATEGORIES), category_key(category)):
+                ids = self._decks.setdefault(key, array('q'))
+                ids.append(question_id)
+                position = self.rng.randrange(len(ids))
+                ids[position], ids[-1] = ids[-1], ids[position]
+
+    def discard(self, question_id):
+        '''Stop drawing a deleted question; it is dropped on the next load.'''
+        with self._lock:
+            self._deleted.add(question_id)
+
+    def draw(self, category, seen=()):
+        '''
+        A random id in category that is not in seen, or None. seen is any
+        container of ids with a fast 'in', such as a set.
+        '''
+        ids = self._decks.get(category_key(category)) if self._decks else None
+        if not ids:
+            return None
+        deleted = self._deleted
+
+        for _ in range(MAX_PICKS):
+            question_id = ids[self.rng.randrange(len(ids))]
+            if question_id not in seen and question_id not in deleted:
+                return question_id
+
+        # Nearly every question has been seen: choose among the rest.
+        unseen = [question_id for question_id in ids
+                  if question_id not in seen and question_id not in deleted]
+        return self.rng.choice(unseen) if unseen else None
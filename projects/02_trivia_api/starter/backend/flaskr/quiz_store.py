@@ -0,0 +1,149 @@
+'''
+Storage for quiz sessions.
+
+A session is the quiz category and a bitmap of the question ids served so
+far, kept under a random id until it has been idle for ttl seconds. The
+bitmap costs one bit per question id, so reading a session is a copy of a
+few kilobytes at most and checking an id is O(1) however long the quiz.
+claim() marks a question served atomically and fails if a concurrent round
+served it first. MemoryQuizStore keeps sessions in process and is the
+default; RedisQuizStore shares them between processes, with the bitmap in
+a Redis string using the same bit order as SETBIT.
+'''
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+class SeenIds(object):
+    '''A set of question ids stored as a bitmap, bit 0 first.'''
+
+    def __init__(self, bits=b''):
+        self.bits = bytearray(bits)
+
+    def __contains__(self, question_id):
+        index = question_id >> 3
+        return index < len(self.bits) and \
+            bool(self.bits[index] & (0x80 >> (question_id & 7)))
+
+    def add(self, question_id):
+        '''Add question_id; returns False if it was already there.'''
+        if question_id in self:
+            return False
+        index = question_id >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(index + 1 - len(self.bits)))
+        self.bits[index] |= 0x80 >> (question_id & 7)
+        return True
+
+    def __len__(self):
+        return bin(int.from_bytes(self.bits, 'big')).count('1')
+
+
+class MemoryQuizStore(object):
+    '''Sessions in process, oldest evicted first once max_size is reached.'''
+
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session_id, category):
+        with self._lock:
+            self._sessions[session_id] = [0, category, SeenIds(), 0]
+            self._touch(session_id, time.monotonic())
+
+    def get(self, session_id):
+        '''{'category', 'seen', 'round'} for the session, or None.'''
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None:
+                return None
+            _, category, seen, rounds = entry
+            return {'category': category, 'seen': SeenIds(seen.bits),
+                    'round': rounds}
+
+    def claim(self, session_id, question_id):
+        '''
+        Mark question_id served; returns the new round number, or None if
+        it was already served or the session is gone.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None or not entry[2].add(question_id):
+                return None
+            entry[3] += 1
+            self._touch(session_id, now)
+            return entry[3]
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _live(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._sessions[session_id]
+            return None
+        return entry
+
+    def _touch(self, session_id, now):
+        self._sessions[session_id][0] = now + self.ttl
+        self._sessions.move_to_end(session_id)
+        # Entries are kept in order of last write, which with a single
+        # ttl is also the order they expire in.
+        while self._sessions:
+            oldest_id, (expires, _, _, _) = next(iter(self._sessions.items()))
+            if expires > now and len(self._sessions) <= self.max_size:
+                break
+            del self._sessions[oldest_id]
+
+
+class RedisQuizStore(object):
+    '''
+    Sessions in Redis, expired by Redis itself: the category under the
+    session key and the served ids under the key with ':seen' appended.
+    '''
+
+    def __init__(self, client, ttl, prefix='trivia:quiz:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def create(self, session_id, category):
+        self.client.setex(self.prefix + session_id, self.ttl, category)
+
+    def get(self, session_id):
+        key = self.prefix + session_id
+        pipe = self.client.pipeline()
+        pipe.get(key)
+        pipe.get(key + ':seen')
+        category, bits = pipe.execute()
+        if category is None:
+            return None
+        seen = SeenIds(bits or b'')
+        return {'category': int(category), 'seen': seen, 'round': len(seen)}
+
+    def claim(self, session_id, question_id):
+        key = self.prefix + session_id
+        pipe = self.client.pipeline()
+        pipe.exists(key)
+        pipe.setbit(key + ':seen', question_id, 1)
+        pipe.bitcount(key + ':seen')
+        pipe.expire(key, self.ttl)
+        pipe.expire(key + ':seen', self.ttl)
+        exists, served, rounds = pipe.execute()[:3]
+        if not exists or served:
+            return None
+        return rounds
+
+    def delete(self, session_id):
+        key = self.prefix + session_id
+        self.client.delete(key, key + ':seen')
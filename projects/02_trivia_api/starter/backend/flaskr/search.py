@@ -0,0 +1,159 @@
+'''
+Full-text search over question and answer text.
+
+On Postgres, questions carry a search_vector tsvector column generated from
+the question (weighted A) and answer (weighted B), with a GIN index (see
+migrations/0001_question_search.sql). Matches are ranked with ts_rank_cd
+and highlighted with ts_headline. On SQLite, used for testing, an FTS5
+table kept in sync by triggers does the same with bm25() and highlight().
+
+Every word of the search term must match the start of a word in the
+question or answer. A page of results and the total number of matches come
+from a single query.
+
+The database marks matches with control characters rather than tags:
+highlight_html escapes the text and only then turns the markers into
+<mark> tags, so nothing in a question is ever sent as HTML.
+'''
+import html
+import re
+import threading
+import weakref
+
+from sqlalchemy import func, text
+
+from models import Question
+
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+FTS_TABLE = 'questions_search'
+
+_fts_engines = weakref.WeakSet()
+_fts_lock = threading.Lock()
+
+POSTGRES_SEARCH = text('''
+SELECT q.id, q.question, q.answer, q.category, q.difficulty,
+       ts_headline('english', coalesce(q.question, ''), query, :options)
+           AS question_highlight,
+       ts_headline('english', coalesce(q.answer, ''), query, :options)
+           AS answer_highlight,
+       page.total
+FROM (
+    SELECT id, ts_rank_cd(search_vector, query) AS score,
+           count(*) OVER () AS total
+    FROM questions, to_tsquery('english', :query) query
+    WHERE search_vector @@ query
+    ORDER BY score DESC, id
+    LIMIT :limit OFFSET :offset
+) page
+JOIN questions q ON q.id = page.id,
+     to_tsquery('english', :query) query
+ORDER BY page.score DESC, q.id
+''')
+
+# FTS5's ranking and highlighting functions only work in a query reading
+# the FTS table directly, so the join and window are done outside it.
+SQLITE_SEARCH = text('''
+SELECT q.id, q.question, q.answer, q.category, q.difficulty,
+       page.question_highlight, page.answer_highlight,
+       count(*) OVER () AS total
+FROM (
+    SELECT rowid AS id, bm25({fts}, 2.0, 1.0) AS score,
+           highlight({fts}, 0, :start, :end) AS question_highlight,
+           highlight({fts}, 1, :start, :end) AS answer_highlight
+    FROM {fts}
+    WHERE {fts} MATCH :match
+) page
+JOIN questions q ON q.id = page.id
+ORDER BY page.score, q.id
+LIMIT :limit OFFSET :offset
+'''.format(fts=FTS_TABLE))
+
+
+def search_questions(session, term, limit, offset=0):
+    '''
+    Search question and answer text for term, best matches first.
+
+    Returns (total, rows): rows are up to limit matches after offset, each
+    with the question's columns plus question_highlight and
+    answer_highlight, the texts with matching words wrapped in
+    HIGHLIGHT_START and HIGHLIGHT_END; total counts every match.
+    '''
+    tokens = re.findall(r'\w+', term or '')
+    params = {'limit': limit, 'offset': offset}
+    bind = session.get_bind()
+    if not tokens:
+        rows = _all_questions(session, limit, offset)
+    elif bind.dialect.name == 'sqlite':
+        _ensure_fts5_table(bind)
+        params.update(match=' '.join('"%s"*' % token for token in tokens),
+                      start=HIGHLIGHT_START, end=HIGHLIGHT_END)
+        rows = session.execute(SQLITE_SEARCH, params).fetchall()
+    else:
+        params.update(query=' & '.join('%s:*' % token for token in tokens),
+                      options='StartSel="%s", StopSel="%s", HighlightAll=true' %
+                      (HIGHLIGHT_START, HIGHLIGHT_END))
+        rows = session.execute(POSTGRES_SEARCH, params).fetchall()
+    total = rows[0].total if rows else 0
+    if not rows and offset:
+        total = search_questions(session, term, 1)[0]
+    return total, rows
+
+
+def highlight_html(highlight):
+    '''A highlight from search_questions as HTML, matches in <mark> tags.'''
+    if highlight is None:
+        return None
+    escaped = html.escape(highlight, quote=False)
+    return escaped.replace(HIGHLIGHT_START, '<mark>')\
+        .replace(HIGHLIGHT_END, '</mark>')
+
+
+def _all_questions(session, limit, offset):
+    # An empty term matches everything, with nothing to highlight.
+    return session.query(
+        Question.id, Question.question, Question.answer, Question.category,
+        Question.difficulty, Question.question.label('question_highlight'),
+        Question.answer.label('answer_highlight'),
+        func.count().over().label('total'))\
+        .order_by(Question.id).limit(limit).offset(offset).all()
+
+
+def _ensure_fts5_table(bind):
+    if bind in _fts_engines:
+        return
+
+    with _fts_lock:
+        if bind in _fts_engines:
+            return
+        with bind.begin() as connection:
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master "
+                "WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}).scalar()
+            if not exists:
+                connection.execute(
+                    "CREATE VIRTUAL TABLE {fts} USING fts5(question, answer, "
+                    "content='questions', content_rowid='id')"
+                    .format(fts=FTS_TABLE))
+                connection.execute(
+                    "CREATE TRIGGER {fts}_ai AFTER INSERT ON questions BEGIN "
+                    "INSERT INTO {fts}(rowid, question, answer) "
+                    "VALUES (new.id, new.question, new.answer); END"
+                    .format(fts=FTS_TABLE))
+                connection.execute(
+                    "CREATE TRIGGER {fts}_ad AFTER DELETE ON questions BEGIN "
+                    "INSERT INTO {fts}({fts}, rowid, question, answer) "
+                    "VALUES ('delete', old.id, old.question, old.answer); END"
+                    .format(fts=FTS_TABLE))
+                connection.execute(
+                    "CREATE TRIGGER {fts}_au AFTER UPDATE ON questions BEGIN "
+                    "INSERT INTO {fts}({fts}, rowid, question, answer) "
+                    "VALUES ('delete', old.id, old.question, old.answer); "
+                    "INSERT INTO {fts}(rowid, question, answer) "
+                    "VALUES (new.id, new.question, new.answer); END"
+                    .format(fts=FTS_TABLE))
+                connection.execute(
+                    "INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+                    .format(fts=FTS_TABLE))
+        _fts_engines.add(bind)
@@ -0,0 +1,12 @@
+-- Full-text search over question and answer text (see flaskr/search.py).
+-- Needs PostgreSQL 12 or later for the generated column. Apply with:
+--   psql trivia < migrations/0001_question_search.sql
+
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(answer, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_questions_search_vector
+    ON questions USING gin (search_vector);
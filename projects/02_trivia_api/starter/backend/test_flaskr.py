@@ -1,11 +1,11 @@
 import os
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
 import random
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.quiz_store import MemoryQuizStore, SeenIds
+from models import db, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -13,19 +13,18 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = "trivia_test"
-        self.database_path = "postgres://{}/{}".format(
-            'postgres:postgres@localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        # e.g. TRIVIA_TEST_DATABASE_URL=sqlite:// to run without Postgres
+        self.database_path = os.environ.get(
+            'TRIVIA_TEST_DATABASE_URL', "postgres://{}/{}".format(
+                'postgres:postgres@localhost:5432', self.database_name))
+        self.app = create_app({'DATABASE_PATH': self.database_path})
+        self.client = self.app.test_client
 
         # binds the app to the current context
         with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
             # create all tables
-            self.db.create_all()
+            db.create_all()
             for x in range(0, 3):
                 self.createCategory(x)
                 self.createQuestion()
@@ -56,6 +55,26 @@ class TriviaTestCase(unittest.TestCase):
         res = self.client().get('/categories')
         self.assertEqual(res.status_code, 200)
 
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        res = self.client().get('/categories', headers={
+            'If-None-Match': res.headers['ETag']
+        })
+        self.assertEqual(res.status_code, 304)
+
+    def test_get_categories_after_insert(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        with self.app.app_context():
+            Category("Geography").insert()
+        res = self.client().get('/categories', headers={
+            'If-None-Match': etag
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Geography', data['categories'])
+
     # getting questions test
     def test_get_questions(self):
         res = self.client().get('/questions')
@@ -67,6 +86,34 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['categories'])
         self.assertEqual(data['current_category'], '')
 
+    def test_get_questions_with_current_categories_version(self):
+        version = json.loads(
+            self.client().get('/categories').data)['categories_version']
+        res = self.client().get(f'/questions?categories_version={version}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('categories', data)
+        self.assertEqual(data['categories_version'], version)
+
+    def test_get_questions_by_cursor(self):
+        res = self.client().get('/questions?per_page=1&total=none')
+        first = json.loads(res.data)
+        res = self.client().get(
+            f"/questions?per_page=1&cursor={first['next_cursor']}")
+        second = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(first['total_questions'])
+        self.assertEqual(len(second['questions']), 1)
+        self.assertGreater(second['questions'][0]['id'],
+                           first['questions'][0]['id'])
+
+    def test_get_questions_invalid_cursor(self):
+        res = self.client().get('/questions?cursor=invalid')
+
+        self.assertEqual(res.status_code, 400)
+
     # deleting question tests
 
     def test_delete_question(self):
@@ -116,7 +163,8 @@ class TriviaTestCase(unittest.TestCase):
 
     # creating question search test
     def test_question_search(self):
-        res = self.client().post('/questions/search', json={"searchTerm": "e"})
+        res = self.client().post('/questions/search',
+                                 json={"searchTerm": "test"})
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 200)
@@ -124,6 +172,35 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertEqual(data['current_category'], '')
 
+    def test_question_search_matches_answer(self):
+        question = Question(question="Who wrote Hamlet?",
+                            answer="Shakespeare",
+                            category=Category.query.first().id, difficulty=1)
+        question.insert()
+        question_id = question.id
+
+        res = self.client().post('/questions/search',
+                                 json={"searchTerm": "shakesp"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'][0]['id'], question_id)
+        self.assertIn('<mark>', data['questions'][0]['highlight']['answer'])
+
+    def test_question_search_escapes_highlight(self):
+        question = Question(question="What does <script> start?",
+                            answer="A script",
+                            category=Category.query.first().id, difficulty=1)
+        question.insert()
+
+        res = self.client().post('/questions/search',
+                                 json={"searchTerm": "script"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'][0]['highlight']['question'],
+                         'What does &lt;<mark>script</mark>&gt; start?')
+
     def test_question_search_no_results(self):
         res = self.client().post('/questions/search',
                                  json={"searchTerm": "winning"})
@@ -153,8 +230,88 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 404)
         self.assertEqual(data['status'], "Failure")
 
-    # def test_get_questions_for_quiz(self):
+    # quiz tests
+    def test_get_questions_for_quiz(self):
+        question = Question.query.first()
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'id': int(question.category), 'type': ''}
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['category'], question.category)
+
+    def test_get_questions_for_quiz_all_seen(self):
+        seen = [question.id for question in Question.query.all()]
+        res = self.client().post('/quizzes', json={
+            'previous_questions': seen,
+            'quiz_category': {'id': 0, 'type': 'click'}
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question'], None)
+
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': {'id': 0, 'type': 'click'}
+        })
+        session_id = json.loads(res.data)['session_id']
+
+        seen = []
+        for _ in range(Question.query.count()):
+            res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn(data['question']['id'], seen)
+            seen.append(data['question']['id'])
+
+        res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+        data = json.loads(res.data)
+        self.assertEqual(data['question'], None)
+        self.assertEqual(data['round'], len(seen))
+
+    def test_quiz_session_not_found(self):
+        res = self.client().post('/quizzes/sessions/missing/next')
+
+        self.assertEqual(res.status_code, 404)
+
+
+
+class QuizStoreTestCase(unittest.TestCase):
+    """Quiz session storage"""
+
+    def test_seen_ids(self):
+        seen = SeenIds()
+        self.assertTrue(seen.add(3))
+        self.assertTrue(seen.add(1000))
+        self.assertFalse(seen.add(3))
+
+        self.assertIn(3, seen)
+        self.assertIn(1000, seen)
+        self.assertNotIn(4, seen)
+        self.assertNotIn(5000, seen)
+        self.assertEqual(len(seen), 2)
+
+    def test_question_is_claimed_once(self):
+        store = MemoryQuizStore(ttl=60)
+        store.create('quiz', 2)
+        state = store.get('quiz')
+
+        self.assertEqual(store.claim('quiz', 7), 1)
+        self.assertIsNone(store.claim('quiz', 7))
+        self.assertEqual(store.claim('quiz', 8), 2)
+        # A state read earlier is a copy, unaffected by later rounds.
+        self.assertNotIn(7, state['seen'])
+        self.assertEqual(store.get('quiz')['round'], 2)
+        self.assertIn(7, store.get('quiz')['seen'])
+
+    def test_claim_on_missing_session(self):
+        store = MemoryQuizStore(ttl=60)
 
+        self.assertIsNone(store.get('missing'))
+        self.assertIsNone(store.claim('missing', 1))
 
 # Make the tests conveniently executable
 if __name__ == "__main__":